@@ -1,5 +1,5 @@
 
 NUM_NODES=5
-python src/util.py $NUM_NODES topologies/blockchain.yaml blockchain
+python src/util.py $NUM_NODES topologies/blockchain.yaml --family blockchain --validators 3
 docker compose build
-docker compose up
\ No newline at end of file
+docker compose up
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator
+
+from ipv8.messaging.serialization import default_serializer
+
+from .block_store import pack_block
+from .messages import Block, TransactionBody
+
+max_block_transactions = 255  # ipv8 packs the length of the transaction list in one byte
+# a block message also carries the community header, the public key and the signature of its
+# sender, about 200 bytes, and must fit in one UDP datagram of at most 65,507 bytes
+max_block_bytes = 64_000
+
+
+def fifo_order(transactions: Iterable[TransactionBody]) -> Iterator[TransactionBody]:
+    """The order in which the transactions arrived."""
+    return iter(transactions)
+
+
+def nonce_order(transactions: Iterable[TransactionBody]) -> Iterator[TransactionBody]:
+    """Arrival order, but the transactions of every sender by increasing message id.
+
+    A sender keeps the positions its transactions arrived at, so senders are
+    interleaved as they arrived, while a transfer that arrived out of order
+    does not overtake the earlier transfers of its sender.
+    """
+    transactions = list(transactions)
+    by_sender: dict[int, list[TransactionBody]] = defaultdict(list)
+    for transaction in transactions:
+        by_sender[transaction.sender_id].append(transaction)
+    for sender_transactions in by_sender.values():
+        sender_transactions.sort(key=lambda transaction: transaction.message_id, reverse=True)
+    return (by_sender[transaction.sender_id].pop() for transaction in transactions)
+
+
+def amount_order(transactions: Iterable[TransactionBody]) -> Iterator[TransactionBody]:
+    """The largest amounts first, transactions carry no fee so the amount stands in for it."""
+    return iter(sorted(transactions, key=lambda transaction: transaction.amount, reverse=True))
+
+
+# the policies a block builder can order the mempool with; more can be registered here
+ordering_policies: dict[str, Callable[[Iterable[TransactionBody]], Iterator[TransactionBody]]] = {
+    "fifo": fifo_order,
+    "nonce": nonce_order,
+    "amount": amount_order,
+}
+
+
+def transaction_size(transaction: TransactionBody) -> int:
+    """Bytes a transaction adds to a packed block."""
+    return len(default_serializer.pack("payload", transaction))
+
+
+@dataclass
+class BlockContents:
+    transactions: list[TransactionBody]
+    size: int  # bytes of the packed block
+    count_fill: float  # fraction of the transaction budget that is used
+    byte_fill: float  # fraction of the byte budget that is used
+
+    @property
+    def fill_ratio(self) -> float:
+        """How full the block is, by the budget that is closest to its limit."""
+        return max(self.count_fill, self.byte_fill)
+
+
+class BlockBuilder:
+    """Selects the pending transactions for a block, within a transaction and a byte budget.
+
+    Candidates are taken in the order of the ordering policy. A candidate that
+    does not fit the remaining bytes is skipped, since a smaller one may still
+    fit; one that the caller does not accept, for instance because its sender
+    cannot afford it, is skipped as well. The fill ratio of every block built
+    is kept for reporting.
+    """
+
+    def __init__(
+        self,
+        max_transactions: int = max_block_transactions,
+        max_bytes: int = max_block_bytes,
+        ordering: str = "fifo",
+    ) -> None:
+        assert ordering in ordering_policies, f"{ordering=}"
+        self.max_transactions = min(max_transactions, max_block_transactions)
+        self.max_bytes = max_bytes
+        self.ordering = ordering
+        self.blocks_built = 0
+        self.total_fill = 0.0
+
+    @property
+    def average_fill(self) -> float | None:
+        return self.total_fill / self.blocks_built if self.blocks_built else None
+
+    def build(
+        self,
+        candidates: Iterable[TransactionBody],
+        accept: Callable[[TransactionBody], bool],
+        height: int,
+        prev_block_hash: bytes,
+        timestamp: int,
+    ) -> BlockContents:
+        size = len(pack_block(Block(height, prev_block_hash, timestamp, [])))
+        transactions = []
+        for transaction in ordering_policies[self.ordering](candidates):
+            if len(transactions) >= self.max_transactions:
+                break
+            transaction_bytes = transaction_size(transaction)
+            if size + transaction_bytes > self.max_bytes:
+                continue
+            if accept(transaction):
+                transactions.append(transaction)
+                size += transaction_bytes
+        contents = BlockContents(
+            transactions,
+            size,
+            len(transactions) / self.max_transactions,
+            size / self.max_bytes,
+        )
+        self.blocks_built += 1
+        self.total_fill += contents.fill_ratio
+        return contents
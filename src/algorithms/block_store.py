@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from hashlib import sha256
+
+from ipv8.messaging.serialization import default_serializer
+
+from .messages import Block
+
+genesis_hash = b"0"  # prev_block_hash of the first block
+
+# on disk, a chain is a block log and an index next to it:
+#   <path>.log: per block a record header (length, crc32) followed by the packed block
+#   <path>.idx: a header (magic, finalized height), then per block (offset, length, height, digest)
+log_extension = ".log"
+index_extension = ".idx"
+record_header = struct.Struct(">II")
+index_header = struct.Struct(">4sQ")
+index_magic = b"BIDX"
+index_entry = struct.Struct(">QIQ32s")
+resident_blocks = 256  # most recent blocks kept in memory when the store is on disk
+sync_every = 16  # blocks appended before the log is fsynced, see BlockStore.sync
+
+
+def pack_block(block: Block) -> bytes:
+    """Serializes a block the same way it is put on the wire."""
+    return default_serializer.pack("payload", block)
+
+
+def unpack_block(data: bytes) -> Block:
+    return default_serializer.unpack(Block, data)[0]
+
+
+def hash_block(block: Block) -> bytes:
+    """Computes the digest of a block, as used in votes and parent links."""
+    return sha256(pack_block(block)).digest()
+
+
+class BlockStore:
+    """The blocks known to a validator, indexed by height and by hash.
+
+    Each stored block is serialized and hashed exactly once, when it is added.
+    Blocks are kept in the order they were added; when two blocks claim the
+    same height, the height index keeps the first one.
+
+    Without a path all blocks stay in memory. With a path, blocks are appended
+    to a block log and only the ``resident`` most recent ones stay in memory;
+    older blocks are read back from a memory map of the log when asked for. The
+    log is fsynced every ``sync_every`` blocks or when ``sync`` is called, and
+    an index entry is only written once its block is durable. On opening, the
+    index is checked against the log, entries missing from the index are
+    recovered from the log, and a torn record at the end is cut off.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        resident: int = resident_blocks,
+        sync_every: int = sync_every,
+    ) -> None:
+        self.path = path
+        self.resident = resident
+        self.sync_every = sync_every
+        self.finalized_height = 0  # persisted with the index, see mark_finalized
+        # per position in the log: where the record is, the block height and the digest
+        self._offsets: list[int] = []
+        self._lengths: list[int] = []
+        self._heights: list[int] = []
+        self._digest_list: list[bytes] = []
+        self._by_height: dict[int, int] = {}  # height: position
+        self._by_hash: dict[bytes, int] = {}  # digest: position
+        # the recently added blocks with their serialization, and their position by id()
+        self._resident: OrderedDict[int, tuple[Block, bytes]] = OrderedDict()
+        self._positions: dict[int, int] = {}
+        self._log_fd: int | None = None
+        self._index_fd: int | None = None
+        self._log_size = 0
+        self._map: mmap.mmap | None = None
+        self._unsynced = 0  # positions not yet in the index file, counted from the end
+        self._synced_finalized_height = 0
+        if path is not None:
+            self._open(path)
+
+    def __len__(self) -> int:
+        return len(self._digest_list)
+
+    def __iter__(self):
+        return (self._load(position) for position in range(len(self)))
+
+    def __contains__(self, block: Block) -> bool:
+        return self.digest(block) in self._by_hash
+
+    def add(self, block: Block) -> bool:
+        """Stores a block, returns False if an identical block is already stored."""
+        packed = pack_block(block)
+        digest = sha256(packed).digest()
+        if digest in self._by_hash:
+            return False
+        position = len(self)
+        offset = self._log_size
+        if self._log_fd is not None:
+            record = record_header.pack(len(packed), zlib.crc32(packed)) + packed
+            os.write(self._log_fd, record)
+            self._log_size += len(record)
+            self._unsynced += 1
+        self._append_entry(offset, len(packed), block.block_height, digest)
+        self._resident[position] = (block, packed)
+        self._positions[id(block)] = position
+        if self.path is not None:
+            while len(self._resident) > self.resident:
+                evicted, _ = self._resident.popitem(last=False)[1]
+                del self._positions[id(evicted)]
+            if self._unsynced >= self.sync_every:
+                self.sync()
+        return True
+
+    def pack(self, block: Block) -> bytes:
+        """The serialized block, memoized for resident blocks."""
+        position = self._positions.get(id(block))
+        if position is None:
+            return pack_block(block)
+        return self._resident[position][1]
+
+    def digest(self, block: Block) -> bytes:
+        """The digest of the block, memoized for resident blocks."""
+        position = self._positions.get(id(block))
+        if position is None:
+            return hash_block(block)
+        return self._digest_list[position]
+
+    def at_height(self, height: int) -> Block | None:
+        position = self._by_height.get(height)
+        return None if position is None else self._load(position)
+
+    def with_hash(self, block_hash: bytes) -> Block | None:
+        position = self._by_hash.get(block_hash)
+        return None if position is None else self._load(position)
+
+    @property
+    def tip(self) -> Block | None:
+        """The most recently added block."""
+        return self._load(len(self) - 1) if len(self) else None
+
+    @property
+    def tip_hash(self) -> bytes:
+        """The hash a new block on top of the tip should refer to."""
+        return self._digest_list[-1] if len(self) else genesis_hash
+
+    @property
+    def height(self) -> int:
+        return self._heights[-1] if len(self) else 0
+
+    def mark_finalized(self, height: int) -> None:
+        """Records the height up to which blocks were executed, it is persisted by the next sync."""
+        self.finalized_height = max(self.finalized_height, height)
+
+    def sync(self) -> None:
+        """Makes the appended blocks durable, then writes their index entries and the finalized height."""
+        if self._log_fd is None:
+            return
+        if self._unsynced:
+            os.fsync(self._log_fd)
+            first = len(self) - self._unsynced
+            os.write(
+                self._index_fd,
+                b"".join(self._pack_entry(position) for position in range(first, len(self))),
+            )
+            self._unsynced = 0
+        elif self.finalized_height == self._synced_finalized_height:
+            return
+        os.pwrite(self._index_fd, index_header.pack(index_magic, self.finalized_height), 0)
+        os.fsync(self._index_fd)
+        self._synced_finalized_height = self.finalized_height
+
+    def close(self) -> None:
+        if self._log_fd is None:
+            return
+        self.sync()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        os.close(self._log_fd)
+        os.close(self._index_fd)
+        self._log_fd = self._index_fd = None
+
+    def _append_entry(self, offset: int, length: int, height: int, digest: bytes) -> None:
+        position = len(self)
+        self._offsets.append(offset)
+        self._lengths.append(length)
+        self._heights.append(height)
+        self._digest_list.append(digest)
+        self._by_height.setdefault(height, position)
+        self._by_hash.setdefault(digest, position)
+
+    def _pack_entry(self, position: int) -> bytes:
+        return index_entry.pack(
+            self._offsets[position],
+            self._lengths[position],
+            self._heights[position],
+            self._digest_list[position],
+        )
+
+    def _load(self, position: int) -> Block:
+        resident = self._resident.get(position)
+        if resident is not None:
+            return resident[0]
+        return unpack_block(self._read(position))
+
+    def _read(self, position: int) -> bytes:
+        start = self._offsets[position] + record_header.size
+        end = start + self._lengths[position]
+        if self._map is None or len(self._map) < end:
+            # the log grew since it was mapped, map all of it again
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._log_fd, 0, access=mmap.ACCESS_READ)
+        return self._map[start:end]
+
+    def _open(self, path: str) -> None:
+        self._log_fd = os.open(path + log_extension, os.O_RDWR | os.O_CREAT, 0o644)
+        self._index_fd = os.open(path + index_extension, os.O_RDWR | os.O_CREAT, 0o644)
+        self._log_size = os.fstat(self._log_fd).st_size
+        indexed = self._recover_index()
+        recovered = self._recover_log()
+        self.finalized_height = min(self.finalized_height, self.height)
+        os.ftruncate(self._log_fd, self._log_size)
+        os.lseek(self._log_fd, self._log_size, os.SEEK_SET)
+        os.ftruncate(self._index_fd, index_header.size + indexed * index_entry.size)
+        os.pwrite(self._index_fd, index_header.pack(index_magic, self.finalized_height), 0)
+        os.lseek(self._index_fd, 0, os.SEEK_END)
+        # recovered blocks were read from the log, so they only miss their index entries
+        self._unsynced = recovered
+        self.sync()
+        # the most recent blocks become resident again
+        for position in range(max(0, len(self) - self.resident), len(self)):
+            packed = self._read(position)
+            block = unpack_block(packed)
+            self._resident[position] = (block, packed)
+            self._positions[id(block)] = position
+
+    def _recover_index(self) -> int:
+        """Loads the index entries that point into the log, returns how many there are."""
+        data = os.pread(self._index_fd, os.fstat(self._index_fd).st_size, 0)
+        if len(data) < index_header.size:
+            return 0
+        magic, finalized_height = index_header.unpack_from(data)
+        if magic != index_magic:
+            raise ValueError(f"{self.path}{index_extension} is not a block index")
+        self.finalized_height = self._synced_finalized_height = finalized_height
+        expected_offset = 0
+        for entry in index_entry.iter_unpack(
+            data[index_header.size : len(data) - (len(data) - index_header.size) % index_entry.size]
+        ):
+            offset, length, height, digest = entry
+            if offset != expected_offset or offset + record_header.size + length > self._log_size:
+                break
+            self._append_entry(offset, length, height, digest)
+            expected_offset = offset + record_header.size + length
+        # the index is only written after an fsync of the log, but the file system may still
+        # have kept the index and lost the log; check the last record, and step back if torn
+        while len(self) and self._check_record(self._offsets[-1]) is None:
+            self._pop_entry()
+        return len(self)
+
+    def _recover_log(self) -> int:
+        """Indexes the valid records after the last indexed one, returns how many there are."""
+        offset = self._offsets[-1] + record_header.size + self._lengths[-1] if len(self) else 0
+        recovered = 0
+        while True:
+            packed = self._check_record(offset)
+            if packed is None:
+                break
+            block = unpack_block(packed)
+            self._append_entry(offset, len(packed), block.block_height, sha256(packed).digest())
+            offset += record_header.size + len(packed)
+            recovered += 1
+        self._log_size = offset  # anything after the last valid record is a torn write
+        return recovered
+
+    def _check_record(self, offset: int) -> bytes | None:
+        """The packed block of the record at offset, None if it is incomplete or corrupt."""
+        header = os.pread(self._log_fd, record_header.size, offset)
+        if len(header) < record_header.size:
+            return None
+        length, checksum = record_header.unpack(header)
+        if offset + record_header.size + length > self._log_size:
+            # a corrupt length, do not allocate it; the record is treated as a torn write
+            return None
+        packed = os.pread(self._log_fd, length, offset + record_header.size)
+        if len(packed) < length or zlib.crc32(packed) != checksum:
+            return None
+        return packed
+
+    def _pop_entry(self) -> None:
+        height = self._heights.pop()
+        digest = self._digest_list.pop()
+        self._offsets.pop()
+        self._lengths.pop()
+        position = len(self)
+        if self._by_height.get(height) == position:
+            del self._by_height[height]
+        if self._by_hash.get(digest) == position:
+            del self._by_hash[digest]
@@ -1,5 +1,4 @@
 import random
-from collections import defaultdict
 
 from ipv8.community import CommunitySettings
 from ipv8.messaging.payload_dataclass import overwrite_dataclass
@@ -8,6 +7,7 @@ from dataclasses import dataclass
 from ipv8.types import Peer
 
 from da_types import Blockchain, message_wrapper
+from .execution import AccountBalances
 
 # We are using a custom dataclass implementation.
 dataclass = overwrite_dataclass(dataclass)
@@ -33,7 +33,7 @@ class BlockchainNode(Blockchain):
 
         self.pending_txs = []
         self.finalized_txs = []
-        self.balances = defaultdict(lambda: 1000)
+        self.balances = AccountBalances(1000, mint_account=None)
 
         self.add_message_handler(Transaction, self.on_transaction)
 
@@ -54,7 +54,7 @@ class BlockchainNode(Blockchain):
                          10,
                          self.counter)
         self.counter += 1
-        print(f'[Node {self.node_id}] Sending transaction {tx.nonce} to {self.node_id_from_peer(peer)}')
+        self.logger.debug('Sending transaction', nonce=tx.nonce, target=self.node_id_from_peer(peer))
         self.ez_send(peer, tx)
 
         if self.counter > self.max_messages:
@@ -73,19 +73,22 @@ class BlockchainNode(Blockchain):
         self.register_task("check_txs", self.check_transactions, delay=2, interval=1)
 
     def check_transactions(self):
-        print(f'Checking transactions')
-        for tx in self.pending_txs:
-            if self.balances[tx.sender] - tx.amount >= 0:
-                self.balances[tx.sender] -= tx.amount
-                self.balances[tx.receiver] += tx.amount
-                self.pending_txs.remove(tx)
-                self.finalized_txs.append(tx)
+        self.logger.debug('Checking transactions', pending=len(self.pending_txs))
+        executed = self.balances.execute(
+            [tx.sender for tx in self.pending_txs],
+            [tx.receiver for tx in self.pending_txs],
+            [tx.amount for tx in self.pending_txs],
+        )
+        still_pending = []
+        for tx, is_executed in zip(self.pending_txs, executed):
+            (self.finalized_txs if is_executed else still_pending).append(tx)
+        self.pending_txs = still_pending
 
         self.executed_checks += 1
 
         if self.executed_checks > 10:
             self.cancel_pending_task("check_txs")
-            print(self.balances)
+            self.logger.info('Final balances', balances=self.balances)
             self.stop()
 
     @message_wrapper(Transaction)
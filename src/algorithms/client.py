@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 from random import randint, choice
 from ipv8.community import CommunitySettings
 from ipv8.types import Peer
@@ -12,11 +14,88 @@ from binascii import hexlify, unhexlify
 client_start_id = 3
 num_clients = 3
 all_clients = [x + client_start_id for x in range(num_clients)]
+history_retention = 1000  # number of recent transactions a client keeps
+# message ids per sender below the highest compacted one that are told apart, older ids are
+# duplicates; a bitmap of this many bits is kept per sender
+history_window = 4096
 
 def to_hex(bstr: bytes) -> str:
     return hexlify(bstr).decode()
 
 
+class TransactionHistory:
+    """The transactions a client has seen, with O(1) duplicate detection and flat memory.
+
+    Only the most recent transactions are kept. Older ones are compacted: their
+    balance change goes into a checkpoint, and per sender only the highest
+    compacted message id is kept, with a bitmap of the compacted ids in a window
+    of ``window`` ids below it. A late copy of a compacted transaction is still a
+    duplicate, and so is any id below the window, while an id inside the window
+    that arrives out of order is not taken for one.
+    """
+
+    def __init__(self, node_id: int, retention: int, window: int = history_window) -> None:
+        self.node_id = node_id
+        self.retention = retention
+        self.window = window
+        self._recent: dict[tuple[int, int], TransactionBody] = {}  # insertion-ordered
+        self._compacted: dict[int, tuple[int, int]] = {}  # sender_id: highest message_id, bitmap
+        self.checkpoint_balance = 0  # balance change of all compacted transactions
+        self._recent_balance = 0  # balance change of the recent transactions
+
+    def __len__(self) -> int:
+        return len(self._recent)
+
+    def __iter__(self):
+        return iter(self._recent.values())
+
+    def __contains__(self, transaction: TransactionBody) -> bool:
+        if (transaction.sender_id, transaction.message_id) in self._recent:
+            return True
+        compacted = self._compacted.get(transaction.sender_id)
+        if compacted is None:
+            return False
+        highest, bitmap = compacted
+        offset = highest - transaction.message_id  # bit 0 is the highest compacted id
+        if offset < 0:
+            return False
+        return offset >= self.window or bool(bitmap >> offset & 1)
+
+    @property
+    def balance(self) -> int:
+        """Our balance after all transactions seen, compacted or not."""
+        return self.checkpoint_balance + self._recent_balance
+
+    def balance_change(self, transaction: TransactionBody) -> int:
+        if transaction.target_id == self.node_id:
+            return transaction.amount
+        if transaction.sender_id == self.node_id:
+            return -transaction.amount
+        return 0
+
+    def add(self, transaction: TransactionBody) -> None:
+        self._recent[(transaction.sender_id, transaction.message_id)] = transaction
+        self._recent_balance += self.balance_change(transaction)
+        while len(self._recent) > self.retention:
+            # compact the oldest transaction into the checkpoint
+            oldest = self._recent.pop(next(iter(self._recent)))
+            change = self.balance_change(oldest)
+            self._recent_balance -= change
+            self.checkpoint_balance += change
+            self._compact(oldest.sender_id, oldest.message_id)
+
+    def _compact(self, sender_id: int, message_id: int) -> None:
+        highest, bitmap = self._compacted.get(sender_id, (message_id, 0))
+        if message_id > highest:
+            # slide the window up, ids that fall out of it count as duplicates from now on
+            bitmap = (bitmap << (message_id - highest)) & ((1 << self.window) - 1)
+            highest = message_id
+        offset = highest - message_id
+        if offset < self.window:
+            bitmap |= 1 << offset
+        self._compacted[sender_id] = (highest, bitmap)
+
+
 class Client(Blockchain):
     """_summary_
     Simple example that just echoes messages between two nodes
@@ -26,14 +105,23 @@ class Client(Blockchain):
 
     def __init__(self, settings: CommunitySettings) -> None:
         super().__init__(settings)
-        self.history: list[TransactionBody] = []
+        self.history_retention = getattr(settings, "history_retention", history_retention)
+        # created in on_start, once our node id is known
+        self.history: TransactionHistory = None  # type:ignore
         self.validators = []
-        self.local_balance = 0
         self.send_counter = 0
-        self.address_book = all_clients
+        # our own copy, several clients may share one process
+        self.address_book = list(getattr(settings, "client_ids", all_clients))
         self.add_message_handler(TransactionBody, self.on_transaction)
 
+    @property
+    def local_balance(self) -> int:
+        """Our balance from the transactions we have seen, including the compacted ones."""
+        return 0 if self.history is None else self.history.balance
+
     def on_start(self):
+        self.history = TransactionHistory(self.node_id, self.history_retention)
+
         # start by announcing ourselves to our only known validator
         self.address_book.remove(self.node_id)
 
@@ -72,11 +160,9 @@ class Client(Blockchain):
                 self.node_id, target_id, amount, self.send_counter
             )
             self.send_counter += 1
-            for validator in self.validators:
-                self.ez_send(self.nodes[validator], transaction)
-                # print(
-                #     f"[C{self.node_id}] sent TX to node {target_id}"
-                # )
+            self.ez_send_many(
+                [self.nodes[validator] for validator in self.validators], transaction
+            )
         else:
             # print(f'[C{self.node_id}] Unable to send amount, state: {self.local_balance=}, {amount=}, {target_id=}')
             pass
@@ -99,13 +185,10 @@ class Client(Blockchain):
         # print(f"[C{self.node_id}] Got a TX {transaction=}")
         if (transaction.target_id == self.node_id or transaction.sender_id == self.node_id) and transaction not in self.history:
             # add transaction to history
-            self.history.append(transaction)
+            self.history.add(transaction)
 
+            # the history keeps the balance
             if transaction.target_id == self.node_id:
-                # add amount to balance
-                self.local_balance += transaction.amount
-                print(f'[C{self.node_id}] Action=incrementing {transaction.amount=} Balance = {self.local_balance}')
+                self.logger.debug("Received amount", amount=transaction.amount, balance=self.local_balance)
             elif transaction.sender_id == self.node_id:
-                # deduct from balance
-                self.local_balance -= transaction.amount
-                print(f'[C{self.node_id}] Action=deducting {transaction.amount=} Balance = {self.local_balance}')
+                self.logger.debug("Sent amount", amount=transaction.amount, balance=self.local_balance)
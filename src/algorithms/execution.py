@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import sys
+from array import array
+from collections.abc import MutableMapping
+from typing import Iterator, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, without it batches are executed one transaction at a time
+    np = None
+
+max_vectorized_retries = 8  # overdrafts in one batch before falling back to the sequential loop
+# balances are stored densely up to the largest account id, so ids are capped; node ids are
+# account ids, and 2**20 accounts take 8 MB
+max_account = (1 << 20) - 1
+
+
+class AccountBalances(MutableMapping):
+    """Account balances in a dense array indexed by account id, with batch execution.
+
+    Behaves like a dict of account id: balance, where unknown accounts have the
+    default balance. ``execute`` applies a whole batch of transfers with the same
+    semantics as executing them one by one: a transfer is skipped when its sender
+    cannot afford it at that point in the batch. With numpy, a batch is applied
+    in vectorized passes, one extra pass per overdraft.
+    """
+
+    def __init__(self, default_balance: int = 0, mint_account: int | None = -1) -> None:
+        self.default_balance = default_balance
+        self.mint_account = mint_account  # transfers from this account create money
+        if np is not None:
+            self._balances = np.full(16, default_balance, dtype=np.int64)
+            self._known = np.zeros(16, dtype=bool)
+        else:
+            self._balances = [default_balance] * 16
+            self._known = [False] * 16
+
+    def _grow(self, last_account: int) -> None:
+        size = len(self._balances)
+        if last_account < size:
+            return
+        new_size = min(max(last_account + 1, 2 * size), max_account + 1)
+        if np is not None:
+            self._balances = np.concatenate(
+                (self._balances, np.full(new_size - size, self.default_balance, dtype=np.int64))
+            )
+            self._known = np.concatenate((self._known, np.zeros(new_size - size, dtype=bool)))
+        else:
+            self._balances.extend([self.default_balance] * (new_size - size))
+            self._known.extend([False] * (new_size - size))
+
+    def __getitem__(self, account: int) -> int:
+        if account < 0 or account >= len(self._balances):
+            return self.default_balance
+        return int(self._balances[account])
+
+    def __setitem__(self, account: int, balance: int) -> None:
+        if not 0 <= account <= max_account:
+            raise KeyError(f"Invalid account {account}")
+        self._grow(account)
+        self._balances[account] = balance
+        self._known[account] = True
+
+    def __delitem__(self, account: int) -> None:
+        if account not in self:
+            raise KeyError(account)
+        self._balances[account] = self.default_balance
+        self._known[account] = False
+
+    def __contains__(self, account: object) -> bool:
+        return (
+            isinstance(account, int)
+            and 0 <= account < len(self._known)
+            and bool(self._known[account])
+        )
+
+    def __iter__(self) -> Iterator[int]:
+        return (account for account, known in enumerate(self._known) if known)
+
+    def __len__(self) -> int:
+        return int(sum(self._known))
+
+    def get(self, account: int, default: int | None = None) -> int | None:
+        return self[account] if account in self else default
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+    def dump(self) -> bytes:
+        """The known accounts and their balances, as pairs of big-endian int64."""
+        if np is not None:
+            accounts = np.flatnonzero(self._known)
+            table = np.empty((len(accounts), 2), dtype=">i8")
+            table[:, 0] = accounts
+            table[:, 1] = self._balances[accounts]
+            return table.tobytes()
+        table = array("q")
+        for account, known in enumerate(self._known):
+            if known:
+                table.append(account)
+                table.append(self._balances[account])
+        if sys.byteorder == "little":
+            table.byteswap()
+        return table.tobytes()
+
+    @classmethod
+    def load(
+        cls, data: bytes, default_balance: int = 0, mint_account: int | None = -1
+    ) -> AccountBalances:
+        """The balances that ``dump`` returned the bytes of."""
+        balances = cls(default_balance, mint_account)
+        if np is not None:
+            table = np.frombuffer(data, dtype=">i8").reshape(-1, 2)
+            if len(table):
+                balances._register(int(table[:, 0].min()), int(table[:, 0].max()))
+                balances._balances[table[:, 0]] = table[:, 1]
+                balances._known[table[:, 0]] = True
+            return balances
+        table = array("q", data)
+        if sys.byteorder == "little":
+            table.byteswap()
+        for account, balance in zip(table[0::2], table[1::2]):
+            balances[account] = balance
+        return balances
+
+    def execute(
+        self, senders: Sequence[int], targets: Sequence[int], amounts: Sequence[int]
+    ) -> list[bool]:
+        """Applies a batch of transfers in order, returns which ones were executed."""
+        if len(amounts) == 0:
+            return []
+        if np is None:
+            accounts = {a for a in (*senders, *targets) if a != self.mint_account}
+            self._register(min(accounts), max(accounts))
+            for account in accounts:
+                self._known[account] = True
+            return self._execute_sequential(senders, targets, amounts, 0, [True] * len(amounts))
+
+        batch = (
+            np.asarray(senders, dtype=np.int64),
+            np.asarray(targets, dtype=np.int64),
+            np.asarray(amounts, dtype=np.int64),
+        )
+        spenders = batch[0][~self._minted(batch[0])]
+        self._register(
+            min(batch[1].min(), spenders.min(initial=batch[1].min())),
+            max(batch[1].max(), spenders.max(initial=batch[1].max())),
+        )
+        self._known[spenders] = True
+        self._known[batch[1]] = True
+        start, accepted = self._execute_vectorized(*batch)
+        if start == len(amounts):
+            return accepted.tolist()
+        # many overdrafts in this batch, finish it one transaction at a time
+        return self._execute_sequential(senders, targets, amounts, start, accepted.tolist())
+
+    def _register(self, first_account: int, last_account: int) -> None:
+        if first_account < 0 or last_account > max_account:
+            raise KeyError(f"Invalid accounts {first_account} to {last_account}")
+        self._grow(int(last_account))
+
+    def _minted(self, senders):
+        if self.mint_account is None:
+            return np.zeros(len(senders), dtype=bool)
+        return senders == self.mint_account
+
+    def _execute_sequential(self, senders, targets, amounts, start, accepted) -> list[bool]:
+        # plain Python ints are much faster to update one at a time than numpy scalars
+        balances = self._balances if np is None else self._balances.tolist()
+        mint_account = self.mint_account
+        for i, sender, target, amount in zip(
+            range(start, len(amounts)), senders[start:], targets[start:], amounts[start:]
+        ):
+            if sender != mint_account:
+                if balances[sender] < amount:
+                    accepted[i] = False
+                    continue
+                balances[sender] -= amount
+            balances[target] += amount
+        if np is not None:
+            self._balances[:] = balances
+        return accepted
+
+    def _execute_vectorized(self, senders, targets, amounts):
+        """Executes as much of the batch as it can in vectorized passes.
+
+        Returns the index up to which the batch was executed, and which transfers were.
+        """
+        n = len(amounts)
+        accepted = np.ones(n, dtype=bool)
+        start = 0
+        for _ in range(max_vectorized_retries):
+            overdrafts = self._overdrafts(senders[start:], targets[start:], amounts[start:])
+            if len(overdrafts) > max_vectorized_retries:
+                # every overdraft costs a pass, the sequential loop is cheaper
+                break
+            end = n if len(overdrafts) == 0 else start + int(overdrafts[0])
+            self._apply(senders[start:end], targets[start:end], amounts[start:end])
+            if end == n:
+                return n, accepted
+            accepted[end] = False
+            start = end + 1
+            if start == n:
+                return n, accepted
+        return start, accepted
+
+    def _events(self, senders, targets, amounts):
+        """Interleaves the debit and credit of every transfer, in execution order."""
+        minted = self._minted(senders)
+        accounts = np.empty(2 * len(amounts), dtype=np.int64)
+        deltas = np.empty(2 * len(amounts), dtype=np.int64)
+        accounts[0::2] = np.where(minted, targets, senders)
+        accounts[1::2] = targets
+        deltas[0::2] = np.where(minted, 0, -amounts)
+        deltas[1::2] = amounts
+        return accounts, deltas
+
+    def _overdrafts(self, senders, targets, amounts):
+        """The indices of the transfers that overdraw, if all transfers before them are executed.
+
+        Only the first one is exact: skipping it changes the balances after it.
+        """
+        accounts, deltas = self._events(senders, targets, amounts)
+        # only accounts that spend more than they have in this batch can ever overdraw
+        spent = np.zeros(len(self._balances), dtype=np.int64)
+        np.add.at(spent, accounts[0::2], -deltas[0::2])
+        at_risk = self._balances < spent
+        if not at_risk.any():
+            return np.empty(0, dtype=np.int64)
+        events = np.flatnonzero(at_risk[accounts])
+        accounts, deltas = accounts[events], deltas[events]
+
+        # running balance of these accounts after each event, via a per-account cumulative sum;
+        # small account ids are sorted as 16-bit keys, for which numpy uses a radix sort
+        keys = accounts.astype(np.uint16) if len(self._balances) <= 1 << 16 else accounts
+        order = np.argsort(keys, kind="stable")
+        sorted_accounts = accounts[order]
+        sorted_deltas = deltas[order]
+        running = np.cumsum(sorted_deltas)
+        is_start = np.r_[True, sorted_accounts[1:] != sorted_accounts[:-1]]
+        group = np.cumsum(is_start) - 1
+        baseline = (running - sorted_deltas)[is_start]
+        after = np.empty_like(running)
+        after[order] = self._balances[sorted_accounts] + running - baseline[group]
+        # debits are the even events; a minted debit has a delta of 0 and never overdraws
+        overdrawn = (after < 0) & (events % 2 == 0) & (deltas < 0)
+        return events[overdrawn] // 2
+
+    def _apply(self, senders, targets, amounts) -> None:
+        accounts, deltas = self._events(senders, targets, amounts)
+        np.add.at(self._balances, accounts, deltas)
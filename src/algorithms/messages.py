@@ -1,4 +1,6 @@
+import struct
 from dataclasses import dataclass
+from typing import Dict, List, Tuple
 
 from hashlib import sha256
 
@@ -15,6 +17,9 @@ def create_hash(item, fmt="payload") -> bytes:
 # We are using a custom dataclass implementation.
 dataclass = overwrite_dataclass(dataclass)
 
+stake_entry = struct.Struct(">qq")  # validator id, stake
+result_entry = struct.Struct(">qqqq")  # validator id, winner id, random seed, number of validators
+
 
 @dataclass(msg_id=1)
 class Announcement:
@@ -86,3 +91,103 @@ class Block:
 class BlockVote:
     block_height: int
     block_hash: bytes
+
+
+@dataclass(msg_id=8)
+class TransactionId:
+    """The identity of a transaction: its sender and the sender's message counter."""
+
+    sender_id: int
+    message_id: int
+
+
+@dataclass(msg_id=9)
+class Inventory:
+    """Announces pending transactions by id, so peers only request the ones they miss."""
+
+    transactions: [TransactionId]
+
+
+@dataclass(msg_id=10)
+class GetTransactions:
+    """Requests the full transactions for a list of announced ids."""
+
+    transactions: [TransactionId]
+
+
+@dataclass(msg_id=11)
+class MempoolSketch:
+    """An invertible Bloom lookup table of the pending transaction ids of a validator."""
+
+    cells: bytes
+
+
+@dataclass(msg_id=12)
+class GetBlocks:
+    """Requests the blocks at heights start_height up to start_height + count - 1."""
+
+    start_height: int
+    count: int
+
+
+@dataclass(msg_id=13)
+class BlockRange:
+    """Consecutive blocks sent in reply to GetBlocks, with the height the sender finalized."""
+
+    finalized_height: int
+    blocks: [Block]
+
+
+@dataclass(msg_id=14)
+class ElectionParticipations:
+    """All participations in an election that the sender knows, packed with pack_stakes."""
+
+    election_round: int
+    sender_id: int
+    origin_id: int  # the node that started the election
+    stakes: bytes
+
+
+@dataclass(msg_id=15)
+class ElectionResults:
+    """All election results that the sender knows, packed with pack_results."""
+
+    election_round: int
+    sender_id: int
+    results: bytes
+
+
+@dataclass(msg_id=16)
+class VoteCertificate:
+    """A quorum of votes for a block, collected by its proposer, packed with pack_node_ids."""
+
+    block_height: int
+    block_hash: bytes
+    voters: bytes
+
+
+def pack_stakes(stakes: Dict[int, int]) -> bytes:
+    return b"".join(stake_entry.pack(node_id, stake) for node_id, stake in stakes.items())
+
+
+def unpack_stakes(data: bytes) -> List[Tuple[int, int]]:
+    if len(data) % stake_entry.size != 0:
+        raise ValueError(f"Invalid stakes of {len(data)} bytes")
+    return list(stake_entry.iter_unpack(data))
+
+
+def pack_results(results: Dict[int, AnnounceConcensusWinner]) -> bytes:
+    return b"".join(
+        result_entry.pack(r.sender_id, r.winner_id, r.random_seed, r.number_of_validators)
+        for r in results.values()
+    )
+
+
+def unpack_results(election_round: int, data: bytes) -> List[AnnounceConcensusWinner]:
+    """The results as the AnnounceConcensusWinner messages that the validators would have flooded."""
+    if len(data) % result_entry.size != 0:
+        raise ValueError(f"Invalid results of {len(data)} bytes")
+    return [
+        AnnounceConcensusWinner(election_round, sender_id, winner_id, random_seed, validators)
+        for sender_id, winner_id, random_seed, validators in result_entry.iter_unpack(data)
+    ]
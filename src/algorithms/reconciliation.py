@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import struct
+from hashlib import sha256
+from typing import Iterable
+
+hash_count = 3  # every key is stored in one cell of each of the sub-tables
+cell_format = struct.Struct(">qqqq")  # count, sender_id sum, message_id sum, check sum
+check_mask = (1 << 63) - 1
+
+
+def _key_hash(key: tuple[int, int]) -> bytes:
+    return sha256(struct.pack(">qq", *key)).digest()
+
+
+class InvertibleBloomLookupTable:
+    """An IBLT over transaction keys, a sketch used for set reconciliation.
+
+    Subtracting the table of one mempool from that of another cancels the keys
+    both have in common, so the remaining table only has to be large enough to
+    hold the differences: about 1.5 cells per differing key. Decoding then
+    lists the keys that are only on either side.
+    """
+
+    def __init__(self, cells_per_hash: int) -> None:
+        self.cells_per_hash = cells_per_hash
+        size = hash_count * cells_per_hash
+        self.counts = [0] * size
+        self.senders = [0] * size
+        self.messages = [0] * size
+        self.checks = [0] * size
+
+    @classmethod
+    def from_keys(
+        cls, keys: Iterable[tuple[int, int]], cells_per_hash: int
+    ) -> InvertibleBloomLookupTable:
+        table = cls(cells_per_hash)
+        for key in keys:
+            table.insert(key)
+        return table
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> InvertibleBloomLookupTable:
+        size = len(data) // cell_format.size
+        if size == 0 or size % hash_count != 0 or len(data) % cell_format.size != 0:
+            raise ValueError(f"Invalid sketch of {len(data)} bytes")
+        table = cls(size // hash_count)
+        for i, cell in enumerate(cell_format.iter_unpack(data)):
+            table.counts[i], table.senders[i], table.messages[i], table.checks[i] = cell
+        return table
+
+    def to_bytes(self) -> bytes:
+        return b"".join(
+            cell_format.pack(*cell)
+            for cell in zip(self.counts, self.senders, self.messages, self.checks)
+        )
+
+    def _cells(self, digest: bytes) -> list[int]:
+        return [
+            i * self.cells_per_hash
+            + int.from_bytes(digest[8 + 4 * i : 12 + 4 * i], "big") % self.cells_per_hash
+            for i in range(hash_count)
+        ]
+
+    def _update(self, key: tuple[int, int], count: int) -> list[int]:
+        digest = _key_hash(key)
+        check = int.from_bytes(digest[:8], "big") & check_mask
+        cells = self._cells(digest)
+        for i in cells:
+            self.counts[i] += count
+            self.senders[i] ^= key[0]
+            self.messages[i] ^= key[1]
+            self.checks[i] ^= check
+        return cells
+
+    def insert(self, key: tuple[int, int]) -> None:
+        self._update(key, 1)
+
+    def subtract(self, other: InvertibleBloomLookupTable) -> InvertibleBloomLookupTable:
+        """The table of the keys in self but not in other (count 1), and vice versa (count -1)."""
+        if other.cells_per_hash != self.cells_per_hash:
+            raise ValueError("Cannot subtract sketches of different sizes")
+        table = InvertibleBloomLookupTable(self.cells_per_hash)
+        table.counts = [a - b for a, b in zip(self.counts, other.counts)]
+        table.senders = [a ^ b for a, b in zip(self.senders, other.senders)]
+        table.messages = [a ^ b for a, b in zip(self.messages, other.messages)]
+        table.checks = [a ^ b for a, b in zip(self.checks, other.checks)]
+        return table
+
+    def _is_pure(self, i: int) -> bool:
+        if self.counts[i] not in (1, -1):
+            return False
+        digest = _key_hash((self.senders[i], self.messages[i]))
+        return self.checks[i] == int.from_bytes(digest[:8], "big") & check_mask
+
+    def decode(self) -> tuple[set[tuple[int, int]], set[tuple[int, int]], bool]:
+        """Peels a subtracted table, destroying it.
+
+        Returns the keys with a positive count, the keys with a negative count, and
+        whether decoding was complete. If it was not, the table was too small for
+        the number of differences.
+        """
+        positive: set[tuple[int, int]] = set()
+        negative: set[tuple[int, int]] = set()
+        queue = [i for i in range(len(self.counts)) if self._is_pure(i)]
+        while queue:
+            i = queue.pop()
+            if not self._is_pure(i):
+                continue
+            count = self.counts[i]
+            key = (self.senders[i], self.messages[i])
+            (positive if count == 1 else negative).add(key)
+            queue.extend(self._update(key, -count))
+        complete = not (
+            any(self.counts) or any(self.senders) or any(self.messages) or any(self.checks)
+        )
+        return positive, negative, complete
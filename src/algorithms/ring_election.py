@@ -38,21 +38,34 @@ class RingElection(Blockchain):
     def __init__(self, settings: CommunitySettings) -> None:
         super().__init__(settings)
         self.running = False
+        self.next_hops = {}  # mid of the peer a message came from: (node_id, peer) to pass it to
+        self.next_hops_version = 0  # version of self.nodes that next_hops was computed for
         # Make sure the register the message handlers for each message type
         self.add_message_handler(ElectionMessage, self.on_message)
         self.add_message_handler(TerminationMessage, self.on_terminate)
 
+    def next_hop(self, peer: Peer):
+        """The other neighbour in the ring, computed once per neighbour until the nodes change."""
+        if self.next_hops_version != self.nodes.version:
+            self.next_hops.clear()
+            self.next_hops_version = self.nodes.version
+        hop = self.next_hops.get(peer.mid)
+        if hop is None:
+            hop = [x for x in self.nodes.items() if x[1] != peer][0]
+            self.next_hops[peer.mid] = hop
+        return hop
+
     async def on_start(self):
         await asyncio.sleep(random.uniform(1.0, 3.0))
         if not self.running:
             peer = list(self.nodes.values())[0]
-            print(f'[Node {self.node_id}] Starting by selecting a node: {self.node_id_from_peer(peer)}')
+            self.logger.info('Starting by selecting a node', target=self.node_id_from_peer(peer))
             self.ez_send(peer, ElectionMessage(self.node_id))
 
     @message_wrapper(TerminationMessage)
     async def on_terminate(self, peer: Peer, _: TerminationMessage) -> None:
         if self.running:
-            _next_node_id, next_peer = [x for x in self.nodes.items() if x[1] != peer][0]
+            _next_node_id, next_peer = self.next_hop(peer)
             self.ez_send(next_peer, TerminationMessage())
             self.running = False
             self.stop()
@@ -61,15 +74,14 @@ class RingElection(Blockchain):
     async def on_message(self, peer: Peer, payload: ElectionMessage) -> None:
         self.running = True
         # Sending it around the ring to the other peer we received it from.
-        next_node_id, next_peer = [x for x in self.nodes.items() if x[1] != peer][0]
-        print(f'[Node {self.node_id}] Got a message from with elector id: {payload.elector}')
+        next_node_id, next_peer = self.next_hop(peer)
+        self.logger.info('Got a message', elector=payload.elector)
 
         received_id = payload.elector
 
         if received_id == self.node_id:
             # We are elected
-            print(f'[Node {self.node_id}] we are elected!')
-            print(f'[Node {self.node_id}] Sending message to terminate the algorithm!')
+            self.logger.info('We are elected, terminating the algorithm', elector=self.node_id)
 
             self.ez_send(next_peer, TerminationMessage())
         elif received_id < self.node_id:
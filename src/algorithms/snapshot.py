@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import os
+import struct
+import sys
+import zlib
+from array import array
+from dataclasses import dataclass
+from itertools import chain
+from typing import Iterable
+
+from .execution import AccountBalances
+
+# a snapshot file is a header followed by the balance table and the finalized transaction keys,
+# both as big-endian int64: (account, balance) and (sender_id, message_id) pairs
+snapshot_extension = ".snapshot"
+snapshot_header = struct.Struct(">4sQ32sQI")  # magic, height, block hash, balance table size, crc32
+snapshot_magic = b"SNAP"
+
+
+@dataclass
+class StateSnapshot:
+    """The account state after executing all blocks up to and including ``height``."""
+
+    height: int
+    block_hash: bytes
+    balances: AccountBalances
+    finalized_transactions: set[tuple[int, int]]
+    size: int  # bytes in the snapshot file
+
+
+def pack_snapshot(
+    height: int,
+    block_hash: bytes,
+    balances: AccountBalances,
+    finalized_transactions: Iterable[tuple[int, int]],
+) -> bytes:
+    """Serializes the state, this is the part of a snapshot that has to run before the state changes."""
+    table = balances.dump()
+    keys = array("q", chain.from_iterable(finalized_transactions))
+    if sys.byteorder == "little":
+        keys.byteswap()
+    body = table + keys.tobytes()
+    return snapshot_header.pack(snapshot_magic, height, block_hash, len(table), zlib.crc32(body)) + body
+
+
+def write_snapshot(path: str, data: bytes) -> None:
+    """Replaces the snapshot at path, atomically: a crash leaves either the old or the new one.
+
+    Blocks on disk I/O, so the validator runs it in a worker thread.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    directory = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    try:
+        os.fsync(directory)
+    finally:
+        os.close(directory)
+
+
+def read_snapshot(path: str, default_balance: int = 0) -> StateSnapshot | None:
+    """The snapshot at path, None if there is none or it is corrupt."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < snapshot_header.size:
+        return None
+    magic, height, block_hash, table_size, checksum = snapshot_header.unpack_from(data)
+    body = data[snapshot_header.size :]
+    if magic != snapshot_magic or zlib.crc32(body) != checksum or (len(body) - table_size) % 16:
+        return None
+    keys = array("q", body[table_size:])
+    if sys.byteorder == "little":
+        keys.byteswap()
+    return StateSnapshot(
+        height,
+        block_hash,
+        AccountBalances.load(body[:table_size], default_balance),
+        set(zip(keys[0::2], keys[1::2])),
+        len(data),
+    )
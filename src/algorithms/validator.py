@@ -1,42 +1,89 @@
-from time import time
-from math import ceil
-import random
+from __future__ import annotations
 
-from threading import RLock
+import os
+import random
+from asyncio import Event, get_running_loop
 from collections import defaultdict
+from math import ceil
+from threading import RLock
+from time import perf_counter, time
+from typing import Iterator
 
 from ipv8.community import CommunitySettings
 from ipv8.types import Peer
-from collections import defaultdict
-from ipv8.messaging.serialization import default_serializer
-from hashlib import sha256
-from da_types import Blockchain, message_wrapper
+
+from da_types import Blockchain, message_wrapper, pack_node_ids, unpack_node_ids
+from .block_builder import BlockBuilder, max_block_bytes, max_block_transactions
+from .block_store import BlockStore, resident_blocks
+from .execution import AccountBalances, max_account
+from .reconciliation import InvertibleBloomLookupTable
+from .snapshot import pack_snapshot, read_snapshot, snapshot_extension, write_snapshot
 from .messages import (
     Announcement,
+    AnnounceConcensusParticipation,
+    AnnounceConcensusWinner,
     Block,
+    BlockRange,
     BlockVote,
-    TransactionBody,
+    ElectionParticipations,
+    ElectionResults,
+    GetBlocks,
+    GetTransactions,
     Gossip,
-    BlockHeader,
-)
-from threading import RLock
-
-from da_types import Blockchain, message_wrapper
-from .messages import (
-    Announcement,
+    Inventory,
+    MempoolSketch,
     TransactionBody,
-    Gossip,
-    AnnounceConcensusParticipation,
-    AnnounceConcensusWinner,
+    TransactionId,
+    VoteCertificate,
+    pack_results,
+    pack_stakes,
+    unpack_results,
+    unpack_stakes,
 )
 
 # parameters
 starting_balance = 5000
-block_width = 5
+block_width = 5  # compatibility cap on the transactions per block, 0 leaves only the builder's budgets
 factor_non_byzantine = 0.66
 early_election_minimum_transactions = (
     4  # number of pending transactions before an early election is called
 )
+gossip_modes = ("flood", "inventory")
+# "flood" forwards every participation and result on its own, "aggregate" sends the whole set
+# a validator knows in one message, whenever that set grows
+election_modes = ("flood", "aggregate")
+election_aggregation_delay = 0.1  # seconds a grown set waits for more growth before it is sent
+# with adaptive timeouts (see Blockchain.round_trip_timeout), waits are counted in timeouts
+# of the slowest validator
+election_aggregation_round_trips = 0.5
+election_grace_round_trips = 2  # a late message may still have to be forwarded once
+block_vote_timeout = 2  # seconds before our votes for unfinalized blocks are sent again, doubled per retry
+block_vote_round_trips = 2
+# "broadcast" sends every vote to every validator, "certificate" sends it to the proposer of the
+# block, which broadcasts the quorum it collected as one VoteCertificate
+vote_modes = ("broadcast", "certificate")
+vote_certificate_history = 64  # certificates a proposer keeps, to answer votes that were sent again
+# "election" elects the leader of every block, "schedule" derives the leaders of the next
+# leader_schedule_length heights from the stakes and seed of one election
+leader_modes = ("election", "schedule")
+leader_schedule_length = 32
+leader_timeout = 10  # seconds without a block while transactions are pending before a new election
+# unfinalized heights in our chain up to which a leader still proposes, 1 waits for every block
+# to be finalized before the next is proposed
+pipeline_depth = 1
+inventory_request_timeout = 2  # seconds before an announced transaction is requested again
+inventory_max_announcers = 4  # peers kept per requested transaction, to request it again from
+reconciliation_interval = 10  # seconds between mempool reconciliations with a random validator
+reconciliation_cells_per_hash = 16  # initial sketch size, decodes about 20 differences
+reconciliation_max_cells_per_hash = 256  # sketches are doubled on failure, up to this size
+block_sync_interval = 1  # seconds between fsyncs of the block log, when the chain is on disk
+snapshot_interval = 100  # finalized blocks between snapshots of the account state, when on disk
+sync_batch_size = 16  # blocks per range request when catching up with the chain
+sync_max_requests = 4  # range requests in flight at once, each to a different validator if possible
+sync_request_delay = 0.5  # seconds before requesting a gap, the missing block may still be on its way
+sync_request_timeout = 2  # seconds before a range request is sent again, to another validator
+sync_window = 1024  # blocks ahead of our chain that are buffered until the blocks before them arrive
+sync_max_response_bytes = 32_000  # a range reply is split into messages of at most this size
 election_phases = (
     "none",
     "announce",
@@ -47,6 +94,83 @@ election_phases = (
 )
 
 
+def transaction_key(transaction: TransactionBody) -> tuple[int, int]:
+    """The identity of a transaction: every sender numbers its own transactions."""
+    return transaction.sender_id, transaction.message_id
+
+
+def list_chunks(items: list, size: int = max_block_transactions) -> Iterator[list]:
+    """Splits the items of a list payload, ipv8 packs the length of a list in one byte."""
+    return (items[start : start + size] for start in range(0, len(items), size))
+
+
+class Mempool:
+    """Insertion-ordered set of transactions, keyed by (sender_id, message_id).
+
+    Membership, insertion and removal are O(1); iteration follows arrival order,
+    so the oldest transactions are the first to be put in a block.
+    """
+
+    def __init__(self) -> None:
+        self._transactions: dict[tuple[int, int], TransactionBody] = {}
+
+    def __len__(self) -> int:
+        return len(self._transactions)
+
+    def keys(self):
+        return self._transactions.keys()
+
+    def __iter__(self):
+        return iter(self._transactions.values())
+
+    def __contains__(self, transaction: TransactionBody) -> bool:
+        return transaction_key(transaction) in self._transactions
+
+    def add(self, transaction: TransactionBody) -> bool:
+        """Adds a transaction, returns False if it was already present."""
+        key = transaction_key(transaction)
+        if key in self._transactions:
+            return False
+        self._transactions[key] = transaction
+        return True
+
+    def get(self, key: tuple[int, int]) -> TransactionBody | None:
+        return self._transactions.get(key)
+
+    def remove(self, transaction: TransactionBody) -> TransactionBody | None:
+        """Removes a transaction if present, and returns it."""
+        return self._transactions.pop(transaction_key(transaction), None)
+
+    def clear(self) -> None:
+        self._transactions.clear()
+
+
+class LeaderSchedule:
+    """The leaders of a range of block heights, drawn proportional to the stakes of an election.
+
+    The leader of a height only depends on the seed, the stakes and the height,
+    so validators that ratified the same election derive the same leaders, even
+    if they install the schedule at slightly different heights. The draws use a
+    private random generator, the process-global one is left alone.
+    """
+
+    def __init__(self, stakes: dict[int, int], seed: int, start_height: int, length: int) -> None:
+        node_ids = sorted(stakes)
+        weights = [stakes[node_id] for node_id in node_ids]
+        self.start_height = start_height
+        self.end_height = start_height + length  # exclusive
+        self.leaders = {
+            height: random.Random(f"{seed}/{height}").choices(node_ids, weights)[0]
+            for height in range(start_height, self.end_height)
+        }
+
+    def __contains__(self, height: int) -> bool:
+        return self.start_height <= height < self.end_height
+
+    def leader(self, height: int) -> int | None:
+        return self.leaders.get(height)
+
+
 class Validator(Blockchain):
     """_summary_
     Simple example that just echoes messages between two nodes
@@ -56,49 +180,214 @@ class Validator(Blockchain):
 
     def __init__(self, settings: CommunitySettings) -> None:
         super().__init__(settings)
-        self.validators: dict[int, Peer] = {}  # dict of nodeID : peer
-        self.clients: dict[int, Peer] = {}  # dict of nodeID : peer
-        self.balances = defaultdict(lambda: 0)  # dict of nodeID: balance
-        self.buffered_transactions: list[TransactionBody] = []
-        self.pending_transactions: list[TransactionBody] = []
-        self.finalized_transactions: list[TransactionBody] = []
+        self.validators = self.peer_map()  # dict of nodeID : peer
+        self.clients = self.peer_map()  # dict of nodeID : peer
+        self.balances = AccountBalances(0)  # dict of nodeID: balance
+        self.buffered_transactions = Mempool()
+        self.pending_transactions = Mempool()
+        self.finalized_transactions: set[tuple[int, int]] = set()  # keys only
         self.can_start = False
         self.receive_lock = RLock()
-        self.blocks = []
+        # "flood" gossips full transactions, "inventory" announces ids that peers request
+        self.gossip_mode = getattr(settings, "gossip_mode", "flood")
+        assert self.gossip_mode in gossip_modes, f"{self.gossip_mode=}"
+        self.requested_transactions: dict[tuple[int, int], float] = {}  # key: time
+        # key: peers that announced a requested transaction, but were not asked for it yet
+        self.transaction_announcers: dict[tuple[int, int], list[Peer]] = {}
+        self.election_mode = getattr(settings, "election_mode", "flood")
+        assert self.election_mode in election_modes, f"{self.election_mode=}"
+        self.leader_mode = getattr(settings, "leader_mode", "election")
+        assert self.leader_mode in leader_modes, f"{self.leader_mode=}"
+        self.leader_schedule_length = getattr(
+            settings, "leader_schedule_length", leader_schedule_length
+        )
+        self.leader_schedule: LeaderSchedule | None = None
+        self.last_block_time = time()  # when the chain last grew, to detect a leader timeout
+        self.block_width = getattr(settings, "block_width", block_width)
+        self.block_builder = BlockBuilder(
+            self.block_width or max_block_transactions,
+            getattr(settings, "max_block_bytes", max_block_bytes),
+            getattr(settings, "block_ordering", "fifo"),
+        )
+        self.pipeline_depth = getattr(settings, "pipeline_depth", pipeline_depth)
+        self.reconciliation_random = random.Random()  # independent of the election seed
+        # with a data directory the chain is kept on disk, see open_block_store
+        self.data_dir = getattr(settings, "data_dir", None)
+        self.resident_blocks = getattr(settings, "resident_blocks", resident_blocks)
+        self.snapshot_interval = getattr(settings, "snapshot_interval", snapshot_interval)
+        self.snapshot_height = 0  # height of the latest snapshot
+        self.blocks = BlockStore()
+        self.finalized_height = 0  # height of the last executed block
         self.block_votes = defaultdict(lambda: set())
+        # height: hash of a block with a quorum of votes, waiting for the heights below it
+        self.quorum_blocks: dict[int, bytes] = {}
+        self.vote_mode = getattr(settings, "vote_mode", "broadcast")
+        assert self.vote_mode in vote_modes, f"{self.vote_mode=}"
+        self.block_proposers: dict[int, int] = {}  # height: validator id, of unfinalized blocks
+        self.vote_certificates: dict[int, tuple[VoteCertificate, float]] = {}  # height: ours, time
+
+        # catching up with the chain, see request_blocks
+        self.peer_heights: dict[int, int] = {}  # validator id: highest block height it has
+        self.sync_target = 0  # highest block height a validator is known to have
+        self.sync_finalized_height = 0  # highest finalized height reported in a range reply
+        self.sync_buffer: dict[int, Block] = {}  # height: block that arrived ahead of our chain
+        self.sync_requests: dict[int, tuple[int, float]] = {}  # first height: validator id, time
+        self.sync_scheduled = False
 
         # elections
         self.election_round = 1
         self.election_phase = "none"
         self.time_since_election = int(time())  # time since last succesful election
         self.available_stake = 100
-        self.active_block_proposal = False
+        self.proposal_waiting = False  # elected, but the pipeline was full, see act_leader
         self.stake_registration = {}  # dict of validatorID : stake
         self.result_registration = {}  # dict of validatorID : payload
         self.election_random_seed = None
         self.election_winner_id = None
+        self.election_origin_id = None  # the node that started the current election
+        self.election_result = None  # our own AnnounceConcensusWinner, with --election aggregate
+        self.election_stakes: dict[int, int] = {}  # the stakes the last winner was drawn from
+        self.election_seed = None  # and the seed it was drawn with
+        self.scheduled_election_messages: set[str] = set()
         self.election_announcement_grace_period = (
             2  # the grace period duration in seconds
         )
         self.election_winner_grace_period = 2
+        self.grace_period_generation = 0  # see start_grace_period
+        self.vote_retries = 0  # times our votes were sent again since the last finalized block
+        self.vote_retry_scheduled = False
 
         # register the handlers
         self.add_message_handler(Gossip, self.on_gossip)
+        self.add_message_handler(Inventory, self.on_inventory)
+        self.add_message_handler(GetTransactions, self.on_get_transactions)
+        self.add_message_handler(MempoolSketch, self.on_mempool_sketch)
         self.add_message_handler(Announcement, self.on_announcement)
         self.add_message_handler(TransactionBody, self.on_transaction)
         self.add_message_handler(Block, self.on_block)
         self.add_message_handler(BlockVote, self.on_block_vote)
+        self.add_message_handler(VoteCertificate, self.on_vote_certificate)
         self.add_message_handler(
             AnnounceConcensusParticipation, self.on_election_announcement
         )
         self.add_message_handler(AnnounceConcensusWinner, self.on_election_result)
+        self.add_message_handler(ElectionParticipations, self.on_election_participations)
+        self.add_message_handler(ElectionResults, self.on_election_results)
+        self.add_message_handler(GetBlocks, self.on_get_blocks)
+        self.add_message_handler(BlockRange, self.on_block_range)
+
+    async def started(
+        self,
+        node_id: int,
+        connections: list[tuple[int, int]],
+        event: Event,
+        use_localhost: bool = True,
+    ) -> None:
+        await super().started(node_id, connections, event, use_localhost)
+        if self.data_dir is not None:
+            # before on_start, which runs as a task once the neighbours are reachable
+            self.open_block_store()
+
+    async def unload(self) -> None:
+        await super().unload()
+        self.blocks.close()
+
+    def storage_path(self) -> str:
+        return os.path.join(self.data_dir, f"validator{self.node_id}")
+
+    def open_block_store(self) -> None:
+        """Opens the chain of this node in the data directory, and restores the account state.
+
+        The state is loaded from the latest snapshot, if its block is in the chain, and
+        the blocks finalized after it are executed again.
+        """
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.blocks = BlockStore(self.storage_path(), self.resident_blocks)
+        self.restore_snapshot()
+        replayed = 0
+        for height in range(self.snapshot_height + 1, self.blocks.finalized_height + 1):
+            block = self.blocks.at_height(height)
+            if block is not None:
+                self.execute_transactions(block.transactions)
+                replayed += 1
+        self.finalized_height = max(self.snapshot_height, self.blocks.finalized_height)
+        self.logger.info(
+            "Recovered chain",
+            height=self.get_block_height(),
+            finalized_height=self.finalized_height,
+            snapshot_height=self.snapshot_height,
+            replayed=replayed,
+        )
+        self.register_task(
+            "sync_blocks", self.blocks.sync, delay=block_sync_interval, interval=block_sync_interval
+        )
+
+    def restore_snapshot(self) -> None:
+        start = perf_counter()
+        snapshot = read_snapshot(self.storage_path() + snapshot_extension)
+        if snapshot is None:
+            return
+        block = self.blocks.with_hash(snapshot.block_hash)
+        if block is None or block.block_height != snapshot.height:
+            # the chain lost the block the snapshot was taken at, execute the chain from genesis
+            self.logger.warning(
+                "Ignoring snapshot of a block that is not in the chain", height=snapshot.height
+            )
+            return
+        self.balances = snapshot.balances
+        self.finalized_transactions = snapshot.finalized_transactions
+        self.snapshot_height = snapshot.height
+        self.logger.info(
+            "Restored snapshot",
+            height=snapshot.height,
+            size=snapshot.size,
+            restore_ms=round((perf_counter() - start) * 1e3, 2),
+        )
+
+    def take_snapshot(self) -> None:
+        """Snapshots the account state at the finalized height, and writes it in a worker thread."""
+        if self.is_pending_task_active("write_snapshot"):
+            return  # the previous snapshot is still being written, try again at the next block
+        block = self.blocks.at_height(self.finalized_height)
+        if block is None:
+            return
+        # the blocks up to the snapshot must be on disk before the snapshot is
+        self.blocks.sync()
+        start = perf_counter()
+        data = pack_snapshot(
+            self.finalized_height,
+            self.blocks.digest(block),
+            self.balances,
+            self.finalized_transactions,
+        )
+        pack_time = perf_counter() - start
+        self.snapshot_height = self.finalized_height
+        height = self.finalized_height
+
+        async def write() -> None:
+            start = perf_counter()
+            await get_running_loop().run_in_executor(
+                None, write_snapshot, self.storage_path() + snapshot_extension, data
+            )
+            self.logger.info(
+                "Wrote snapshot",
+                height=height,
+                size=len(data),
+                pack_ms=round(pack_time * 1e3, 2),
+                write_ms=round((perf_counter() - start) * 1e3, 2),
+            )
+
+        self.register_task("write_snapshot", write)
+
+    def probe_targets(self):
+        return self.validators.values()
 
     def on_start(self):
         # announce ourselves to the other nodes as a validator
         for peer in self.nodes.values():
             self.ez_send(peer, Announcement(self.node_id, False))
         # set the initial values
-        print(f"{self.nodes}")
+        self.logger.debug("Known nodes", nodes=self.nodes)
         self.genesis_block()
 
         # register tasks
@@ -114,40 +403,59 @@ class Validator(Blockchain):
             interval=3,
         )
         self.register_task("election_timer", self.start_election, delay=8, interval=30)
+        self.register_task(
+            "reconcile_mempool",
+            self.reconcile_mempool,
+            delay=reconciliation_interval,
+            interval=reconciliation_interval,
+        )
+        # requests transactions that were not delivered from another announcer, or forgets them
+        self.register_task(
+            "retry_transaction_requests",
+            self.retry_transaction_requests,
+            delay=inventory_request_timeout,
+            interval=inventory_request_timeout,
+        )
+        # sends range requests that timed out again, gaps are requested as soon as they are seen
+        self.register_task(
+            "request_blocks",
+            self.request_blocks,
+            delay=sync_request_timeout,
+            interval=sync_request_timeout,
+        )
 
     def init_transaction(self):
         """The init transactions are executed after the announcements have been completed."""
-        print("Init TX")
+        self.logger.debug("Creating init transactions", clients=len(self.clients))
         for node_id in self.clients:
             # if the node_id was not in the validator database, add it
             if node_id not in self.balances:
                 self.balances[node_id] = starting_balance
-            transaction = TransactionBody(-1, node_id, starting_balance, 0)
-            print(f"Creating transaction: {transaction=}")
-            print(f"{self.clients=}")
-            self.buffered_transactions.append(transaction)
+            # the client id doubles as message id, so every init transaction has its own key
+            transaction = TransactionBody(-1, node_id, starting_balance, node_id)
+            self.logger.debug("Creating init transaction", transaction=transaction)
+            self.buffered_transactions.add(transaction)
 
     # TODO only execute if we have block finality
     def execute_transactions(self, transactions):
         """Executes a set of transactions if approved"""
+        # transfers that the sender cannot afford are skipped, the others are applied as one batch
+        self.balances.execute(
+            [transaction.sender_id for transaction in transactions],
+            [transaction.target_id for transaction in transactions],
+            [transaction.amount for transaction in transactions],
+        )
         for transaction in transactions:
             if transaction.sender_id == -1:
-                self.balances[transaction.target_id] += transaction.amount
-                print(f"Executing special {transaction=}")
-            elif self.balances[transaction.sender_id] >= transaction.amount:
-                # print(f'Executing {transaction=}')
-                self.balances[transaction.sender_id] -= transaction.amount
-                self.balances[transaction.target_id] += transaction.amount
+                self.logger.debug("Executing init transaction", transaction=transaction)
             # send transaction to target client
-            target_id = transaction.target_id
-            sender_id = transaction.sender_id
-
-            for node_id, peer in self.clients.items():
-                if node_id == target_id or node_id == sender_id:
+            for node_id in {transaction.sender_id, transaction.target_id}:
+                peer = self.clients.get(node_id)
+                if peer is not None:
                     self.ez_send(peer, transaction)
 
             self.pending_transactions.remove(transaction)
-            self.finalized_transactions.append(transaction)
+            self.finalized_transactions.add(transaction_key(transaction))
 
     def genesis_block(self):
         pass
@@ -155,105 +463,260 @@ class Validator(Blockchain):
         # self.blocks.append(Block(self.get_block_height()+1, prev_block_hash, 1, []))
 
     def validate_block(self, block: Block) -> bool:
-        # @TODO FIX THIS FUNCTION!
+        """Checks that a block extends our chain and that all of its transactions can be executed."""
+        if block.block_height != self.get_block_height() + 1:
+            self.logger.debug(
+                "Invalid block: height does not follow",
+                height=block.block_height,
+                chain_height=self.get_block_height(),
+            )
+            return False
+        # the parent hash is cached by the block store, so this costs no serialization
+        if block.prev_block_hash != self.blocks.tip_hash:
+            self.logger.debug(
+                "Invalid block: parent is not the tip",
+                height=block.block_height,
+                prev_block_hash=block.prev_block_hash.hex(),
+                tip_hash=self.blocks.tip_hash.hex(),
+            )
+            return False
+
+        # check all transactions against the state the chain will have before this block
+        projected, claimed = self.projected_state()
+        for transaction in block.transactions:
+            if not self.project_transaction(projected, claimed, transaction):
+                self.logger.debug(
+                    "Invalid block: cannot execute transaction",
+                    height=block.block_height,
+                    transaction=transaction,
+                )
+                return False
         return True
-        if len(self.blocks) == 0:
-            return True
-        prev_block_hash = b"0"
-        if len(self.blocks) > 0:
-            prev_block_hash = sha256(
-                default_serializer.pack("payload", self.blocks[-1])
-            ).digest()
-        if block.prev_block_hash == prev_block_hash:
-            # Check all transactions
-            return True
-        else:
-            print(f"Invalid: {block.prev_block_hash} == {prev_block_hash}")
+
+    def projected_state(self) -> tuple[dict[int, int], set[tuple[int, int]]]:
+        """The balances and claimed transactions after the stored, but not yet finalized, blocks."""
+        projected: dict[int, int] = {}  # only the balances that differ from self.balances
+        claimed: set[tuple[int, int]] = set()
+        for height in range(self.finalized_height + 1, self.get_block_height() + 1):
+            block = self.blocks.at_height(height)
+            if block is None:
+                continue
+            for transaction in block.transactions:
+                self.project_transaction(projected, claimed, transaction)
+        return projected, claimed
+
+    def project_transaction(
+        self,
+        projected: dict[int, int],
+        claimed: set[tuple[int, int]],
+        transaction: TransactionBody,
+    ) -> bool:
+        """Applies a transaction to a projected state, returns False if it cannot be executed."""
+        key = transaction_key(transaction)
+        if key in claimed or key in self.finalized_transactions:
+            return False
+        # account ids are node ids up to max_account, the mint account -1 only sends
+        if not 0 <= transaction.target_id <= max_account:
             return False
+        if transaction.sender_id != -1 and not 0 <= transaction.sender_id <= max_account:
+            return False
+        if transaction.sender_id != -1:
+            balance = projected.get(
+                transaction.sender_id, self.balances.get(transaction.sender_id, 0)
+            )
+            if balance < transaction.amount:
+                return False
+            projected[transaction.sender_id] = balance - transaction.amount
+        projected[transaction.target_id] = (
+            projected.get(
+                transaction.target_id, self.balances.get(transaction.target_id, 0)
+            )
+            + transaction.amount
+        )
+        claimed.add(key)
+        return True
+
+    def unfinalized_heights(self) -> int:
+        return self.get_block_height() - self.finalized_height
+
+    def can_propose(self) -> bool:
+        """Whether the pipeline has room for another unfinalized height."""
+        return self.unfinalized_heights() < self.pipeline_depth
 
     def act_leader(self):
+        self.proposal_waiting = False
         if self.node_id != self.election_winner_id:
             return
-        if self.active_block_proposal:
+        if not self.can_propose():
+            # proposed by finalize_block, once the pipeline has room again
+            self.proposal_waiting = True
             return
-        self.active_block_proposal = True
         self.form_block()
 
-    def form_block(self):
+    def form_block(self) -> Block | None:
+        """Proposes the next block, None if it would be an empty block on top of unfinalized ones."""
         # We assume that blocks are ordered.
-        prev_block_hash = b"0"
-        if len(self.blocks) > 0:
-            prev_block_hash = sha256(
-                default_serializer.pack("payload", self.blocks[-1])
-            ).digest()
-
-        block = Block(
-            self.get_block_height() + 1,
-            prev_block_hash,
-            int(time()),
-            [tx for tx in self.pending_transactions[:block_width]],
+        # only propose transactions that other validators will accept; the projected state
+        # includes the unfinalized blocks, so transactions they claimed are left out
+        projected, claimed = self.projected_state()
+        height, timestamp = self.get_block_height() + 1, int(time())
+        contents = self.block_builder.build(
+            self.pending_transactions,
+            lambda transaction: self.project_transaction(projected, claimed, transaction),
+            height,
+            self.blocks.tip_hash,
+            timestamp,
+        )
+        if not contents.transactions and self.unfinalized_heights() > 0:
+            return None
+        self.logger.debug(
+            "Built block",
+            height=height,
+            transactions=len(contents.transactions),
+            size=contents.size,
+            fill_ratio=round(contents.fill_ratio, 3),
+            pending=len(self.pending_transactions),
         )
 
-        self.blocks.append(block)
+        block = Block(height, self.blocks.tip_hash, timestamp, contents.transactions)
+
+        self.blocks.add(block)
 
         # Gossip to other nodes
-        for peer in self.validators.values():
-            self.ez_send(peer, block)
+        self.ez_send_many(self.validators.values(), block)
 
         # We confirm our own block
         # @TODO: DO conformation
         self.broadcast_block_confirmation(block)
+        return block
 
     def get_block_height(self):
-        if len(self.blocks) > 0:
-            return self.blocks[-1].block_height
-        return 0
+        return self.blocks.height
 
-    def broadcast_block_confirmation(self, block):
-        block_package = default_serializer.pack("payload", block)
-        block_hash = sha256(block_package).digest()
+    def broadcast_block_confirmation(self, block, proposer_id: int | None = None):
+        """Votes for a block, with vote certificates only to proposer_id, None for our own blocks."""
+        block_hash = self.blocks.digest(block)
         block_vote = BlockVote(block.block_height, block_hash)
         self.block_votes[block_hash].add(self.node_id)
-        for peer in self.validators.values():
-            self.ez_send(peer, block_vote)
+        if self.vote_mode == "certificate":
+            self.block_proposers[block.block_height] = (
+                self.node_id if proposer_id is None else proposer_id
+            )
+            self.send_vote(block_vote)
+        else:
+            self.ez_send_many(self.validators.values(), block_vote)
+        self.schedule_vote_retry()
+
+    def send_vote(self, block_vote: BlockVote) -> None:
+        """Sends a vote to the proposer of its block, our own votes for our own blocks stay here."""
+        proposer = self.validators.get(self.block_proposers.get(block_vote.block_height))
+        if proposer is not None:
+            self.ez_send(proposer, block_vote)
+
+    def block_proposer(self, height: int) -> int | None:
+        """The leader of a height, if we know it; for blocks that did not come from their proposer."""
+        if self.leader_schedule is not None and height in self.leader_schedule:
+            return self.leader_schedule.leader(height)
+        return self.election_winner_id
+
+    def schedule_vote_retry(self) -> None:
+        """Sends our votes again if the blocks they are for are not finalized in time."""
+        if self.vote_retry_scheduled:
+            return
+        self.vote_retry_scheduled = True
+        delay = self.round_trip_timeout(
+            self.validators.values(), block_vote_timeout, block_vote_round_trips, self.vote_retries
+        )
+        self.register_anonymous_task("retry_block_votes", self.retry_block_votes, delay=delay)
+
+    def retry_block_votes(self) -> None:
+        """Votes again for the unfinalized blocks in our chain, a lost vote would stall them."""
+        self.vote_retry_scheduled = False
+        height = self.get_block_height()
+        if self.finalized_height >= height:
+            return
+        for block_height in range(self.finalized_height + 1, height + 1):
+            block = self.blocks.at_height(block_height)
+            if block is not None:
+                block_vote = BlockVote(block_height, self.blocks.digest(block))
+                if self.vote_mode == "certificate" and self.vote_retries == 0:
+                    # later retries go to every validator, in case we took the wrong
+                    # validator for the proposer; they then count the votes themselves
+                    self.send_vote(block_vote)
+                else:
+                    self.ez_send_many(self.validators.values(), block_vote)
+        self.logger.debug(
+            "Sent votes again", start=self.finalized_height + 1, end=height, retries=self.vote_retries
+        )
+        self.vote_retries += 1
+        self.schedule_vote_retry()
 
     def send_buffered_transactions(self):
         """Function to broadcast the buffered transactions on the network."""
         with self.receive_lock:
             # get all buffered transactions
             for transaction in self.buffered_transactions:
-                if transaction not in self.pending_transactions:
-                    self.pending_transactions.append(transaction)
+                self.pending_transactions.add(transaction)
 
             # bundle the valid transactions in a gossip and send it on the network
-            gossip_message = Gossip(self.buffered_transactions)
-            self.broadcast(gossip_message, self.my_peer, validators=True, clients=False)
+            if len(self.buffered_transactions) > 0:
+                self.gossip_transactions(list(self.buffered_transactions), self.my_peer)
 
             # print(f"Sending {len(self.buffered_transactions)} buffered transactions")
-            self.buffered_transactions = []
+            self.buffered_transactions.clear()
+            if self.leader_schedule is not None:
+                self.check_leader_timeout()
+                self.propose_if_leader()
             if len(self.pending_transactions) >= early_election_minimum_transactions:
                 self.start_election()
 
+    def gossip_transactions(self, transactions: list[TransactionBody], originator: Peer):
+        """Passes new pending transactions on to the other validators, in the configured gossip mode."""
+        for chunk in list_chunks(transactions):
+            if self.gossip_mode == "inventory":
+                message = Inventory([TransactionId(*transaction_key(tx)) for tx in chunk])
+            else:
+                message = Gossip(chunk)
+            self.broadcast(message, originator, validators=True, clients=False)
+
     def start_election(self):
         """Starts an election."""
         if self.election_phase != "none":
             return
+        if self.leader_schedule is not None and self.get_block_height() + 1 in self.leader_schedule:
+            return  # the leader of the next block is already known
         self.election_announce(self.node_id)
 
     def election_announce(self, origin_id: int):
         """Broadcasts election participation."""
         if self.election_phase != "announce_grace":
             self.election_phase = "announce"
-        print(
-            f" [V{self.node_id}] Election {self.election_round} phase: {self.election_phase} started by {origin_id}"
+        self.logger.debug(
+            "Election started",
+            round=self.election_round,
+            phase=self.election_phase,
+            origin=origin_id,
         )
         self.election_winner_id = None
+        self.election_origin_id = origin_id
         stake = round(self.available_stake * (0.3 + random.random() * 0.4))
         self.stake_registration[self.node_id] = stake
+        self.logger.debug("Announcing participation", stake=stake)
+        if self.election_mode == "aggregate":
+            self.send_election_participations()
+            return
         message = AnnounceConcensusParticipation(
             self.election_round, self.node_id, stake, origin_id
         )
-        print(message)
+        self.broadcast(message, self.my_peer, validators=True, clients=False)
+
+    def send_election_participations(self):
+        message = ElectionParticipations(
+            self.election_round,
+            self.node_id,
+            self.election_origin_id,
+            pack_stakes(self.stake_registration),
+        )
         self.broadcast(message, self.my_peer, validators=True, clients=False)
 
     @message_wrapper(AnnounceConcensusParticipation)
@@ -261,32 +724,9 @@ class Validator(Blockchain):
         self, peer: Peer, payload: AnnounceConcensusParticipation
     ):
         """When an election participation is received, save the result."""
-        print(
-            f" [V{self.node_id}] received election participation from {payload.sender_id}:"
-        )
-
-        # check whether we're able to receive participations
-        if self.election_phase not in ("none", "announce", "announce_grace"):
-            print(
-                f"[V{self.node_id}] received election participation from {payload.sender_id}, but is in phase {self.election_phase}, ignoring"
-            )
-            return
-
-        # check whether this is a valid election round
-        if payload.election_round < self.election_round:
-            print(
-                f"Ignoring received old election announcement (round {payload.election_round=}<{self.election_round=})"
-            )
+        self.logger.debug("Received election participation", sender=payload.sender_id)
+        if not self.accept_election_participation(peer, payload.election_round, payload.sender_id):
             return
-        elif payload.election_round > self.election_round:
-            self.election_round = payload.election_round
-
-        # if the message came from an unseen validator, add it to the known validators
-        if (
-            payload.sender_id not in self.validators
-            and payload.sender_id != self.node_id
-        ):
-            self.validators[payload.sender_id] = peer
 
         # send our own participation if not done yet
         if self.election_phase == "none":
@@ -296,29 +736,110 @@ class Validator(Blockchain):
         if payload.sender_id not in self.stake_registration:
             self.stake_registration[payload.sender_id] = payload.stake
             self.broadcast(payload, peer, validators=True, clients=False)
+        self.check_election_participations()
+
+    @message_wrapper(ElectionParticipations)
+    async def on_election_participations(self, peer: Peer, payload: ElectionParticipations):
+        """When the participations another validator knows are received, save the new ones.
+
+        Our own set is only sent on when it grew, so every validator sends it at most
+        once per participant instead of forwarding every participation separately.
+        """
+        self.logger.debug("Received election participations", sender=payload.sender_id)
+        try:
+            stakes = unpack_stakes(payload.stakes)
+        except ValueError:
+            self.logger.warning(
+                "Received invalid election participations",
+                sender=payload.sender_id,
+                size=len(payload.stakes),
+            )
+            return
+        if not self.accept_election_participation(peer, payload.election_round, payload.sender_id):
+            return
+
+        grew = False
+        for sender_id, stake in stakes:
+            if sender_id not in self.stake_registration:
+                self.stake_registration[sender_id] = stake
+                grew = True
 
+        # our own participation is sent along with the set
+        if self.election_phase == "none":
+            self.election_announce(payload.origin_id)
+        elif grew:
+            self.schedule_election_message(self.send_election_participations)
+        self.check_election_participations()
+
+    def accept_election_participation(self, peer: Peer, election_round: int, sender_id: int) -> bool:
+        """Checks whether a participation can be registered, and follows a newer election round."""
+        # check whether we're able to receive participations
+        if self.election_phase not in ("none", "announce", "announce_grace"):
+            self.logger.debug(
+                "Ignoring election participation",
+                sender=sender_id,
+                phase=self.election_phase,
+            )
+            return False
+
+        # check whether this is a valid election round
+        if election_round < self.election_round:
+            self.logger.debug(
+                "Ignoring old election participation",
+                round=election_round,
+                current_round=self.election_round,
+            )
+            return False
+        elif election_round > self.election_round:
+            self.election_round = election_round
+
+        # if the message came from an unseen validator, add it to the known validators
+        if sender_id not in self.validators and sender_id != self.node_id:
+            self.validators[sender_id] = peer
+        return True
+
+    def check_election_participations(self):
         # if we have received the minimum expected announcements, start a grace period
         if len(self.stake_registration) - 1 >= ceil(
             len(self.validators) * factor_non_byzantine
         ):  # minus 1 on stake_registration because that includes ourselves
             # after the grace period, figure out the winner
             self.election_phase = "announce_grace"
-            # cancel pending tasks to avoid double execution, like a barrier
-            self.cancel_pending_task("election_announce_participation_grace_period")
-            self.cancel_pending_task("election_announce_winner_grace_period")
-            self.register_task(
-                "election_announce_participation_grace_period",
-                self.election_announce_winner,
-                delay=self.election_announcement_grace_period,
+            # restarts the grace period, like a barrier
+            grace_period = self.start_grace_period(
+                self.election_announce_winner, self.election_announcement_grace_period
             )
-            print(f"Node {self.node_id} Election phase: {self.election_phase}")
+            self.logger.debug("Election phase", phase=self.election_phase, grace_period=grace_period)
+
+    def start_grace_period(self, callback, fixed: float) -> float:
+        """Runs callback when the grace period ends, replacing a running grace period.
+
+        Grace periods are anonymous tasks that only run if no other grace period was
+        started or cancelled since: a named task that is cancelled and registered
+        again can outlive its cancellation, which matters once grace periods are
+        as short as a few round trips.
+        """
+        self.cancel_grace_period()
+        generation = self.grace_period_generation
+        grace_period = self.round_trip_timeout(
+            self.validators.values(), fixed, election_grace_round_trips
+        )
+
+        def end_grace_period():
+            if generation == self.grace_period_generation:
+                callback()
+
+        self.register_anonymous_task(callback.__name__, end_grace_period, delay=grace_period)
+        return grace_period
+
+    def cancel_grace_period(self) -> None:
+        self.grace_period_generation += 1
 
     def election_announce_winner(self):
         """Calculates and broadcasts the election winner."""
         assert self.election_phase not in ("none", "ratify"), f"{self.election_phase=}"
-        # cancel pending tasks to avoid double execution, like a barrier
-        self.cancel_pending_task("election_announce_participation_grace_period")
-        self.cancel_pending_task("election_announce_winner_grace_period")
+        # cancel the grace periods to avoid double execution, like a barrier
+        self.cancel_grace_period()
         self.election_phase = "elect"
         # print(
         #     f" [V{self.node_id}] Election {self.election_round} phase: {self.election_phase}"
@@ -330,11 +851,14 @@ class Validator(Blockchain):
 
         # the random seed is used to choose the validator proportional to the stakes, ordered by node ID
         self.stake_registration = dict(sorted(self.stake_registration.items()))
+        # kept for the leader schedule, the registration is reset when the election is ratified
+        self.election_stakes = self.stake_registration
+        self.election_seed = self.election_random_seed
         self.election_winner_id = random.choices(
             list(self.stake_registration.keys()), list(self.stake_registration.values())
         )[0]
-        print(
-            f" [V{self.node_id}] elected {self.election_winner_id} with seed {self.election_random_seed}"
+        self.logger.debug(
+            "Elected", winner=self.election_winner_id, seed=self.election_random_seed
         )
 
         # broadcast the election result and number of validators
@@ -345,60 +869,117 @@ class Validator(Blockchain):
             self.election_random_seed,
             len(self.validators),
         )
+        if self.election_mode == "aggregate":
+            self.election_result = message
+            self.send_election_results()
+            return
+        self.broadcast(message, self.my_peer, validators=True, clients=False)
+
+    def schedule_election_message(self, send) -> None:
+        """Sends a set after the aggregation delay, so that growth in quick succession is sent once."""
+        if send.__name__ in self.scheduled_election_messages:
+            return
+        self.scheduled_election_messages.add(send.__name__)
+
+        def delayed_send():
+            self.scheduled_election_messages.discard(send.__name__)
+            send()
+
+        delay = self.round_trip_timeout(
+            self.validators.values(), election_aggregation_delay, election_aggregation_round_trips
+        )
+        self.register_anonymous_task(send.__name__, delayed_send, delay=delay)
+
+    def send_election_results(self):
+        # our own result is sent along with the received ones, but not registered, like when flooding
+        results = dict(self.result_registration)
+        results[self.node_id] = self.election_result
+        message = ElectionResults(self.election_round, self.node_id, pack_results(results))
         self.broadcast(message, self.my_peer, validators=True, clients=False)
 
     @message_wrapper(AnnounceConcensusWinner)
     async def on_election_result(self, peer: Peer, payload: AnnounceConcensusWinner):
         """When an election winner is received, store it for verification."""
-        print(f" [V{self.node_id}] received election result from {payload.sender_id}:")
+        self.logger.debug("Received election result", sender=payload.sender_id)
+        if not self.accept_election_result(peer, payload.election_round, payload.sender_id):
+            return
 
+        # send our own result if not done yet
+        if self.election_winner_id is None:
+            self.election_announce_winner()
+
+        # save the received results and broadcast
+        if payload.sender_id not in self.result_registration:
+            self.result_registration[payload.sender_id] = payload
+            self.broadcast(payload, peer, validators=True, clients=False)
+        self.check_election_results()
+
+    @message_wrapper(ElectionResults)
+    async def on_election_results(self, peer: Peer, payload: ElectionResults):
+        """When the results another validator knows are received, save the new ones.
+
+        Like the participations, our own set is only sent on when it grew.
+        """
+        self.logger.debug("Received election results", sender=payload.sender_id)
+        try:
+            results = unpack_results(payload.election_round, payload.results)
+        except ValueError:
+            self.logger.warning(
+                "Received invalid election results",
+                sender=payload.sender_id,
+                size=len(payload.results),
+            )
+            return
+        if not self.accept_election_result(peer, payload.election_round, payload.sender_id):
+            return
+
+        grew = False
+        for result in results:
+            if result.sender_id != self.node_id and result.sender_id not in self.result_registration:
+                self.result_registration[result.sender_id] = result
+                grew = True
+
+        # our own result is sent along with the set
+        if self.election_winner_id is None:
+            self.election_announce_winner()
+        elif grew:
+            self.schedule_election_message(self.send_election_results)
+        self.check_election_results()
+
+    def accept_election_result(self, peer: Peer, election_round: int, sender_id: int) -> bool:
+        """Checks whether a result can be registered in the current election."""
         # check whether we're able to receive results
         if self.election_phase in ("none", "ratify"):
-            print(
-                f"[V{self.node_id}] received election result from {payload.sender_id}, but is in phase {self.election_phase}, ignoring"
+            self.logger.debug(
+                "Ignoring election result", sender=sender_id, phase=self.election_phase
             )
-            return
+            return False
 
         # check whether this is a valid election round
-        if payload.election_round < self.election_round:
-            print(
-                f"Ignoring received old election announcement (round {payload.election_round=}<{self.election_round=})"
+        if election_round < self.election_round:
+            self.logger.debug(
+                "Ignoring old election result",
+                round=election_round,
+                current_round=self.election_round,
             )
-            return
-        elif payload.election_round > self.election_round:
+            return False
+        elif election_round > self.election_round:
             # self.election_round = payload.election_round
             raise ValueError("TF is going on here")
 
         # if the message came from an unseen validator, add it to the known validators
-        if (
-            payload.sender_id not in self.validators
-            and payload.sender_id != self.node_id
-        ):
-            self.validators[payload.sender_id] = peer
-
-        # send our own result if not done yet
-        if self.election_winner_id is None:
-            self.election_announce_winner()
-
-        # save the received results and broadcast
-        if payload.sender_id not in self.result_registration:
-            self.result_registration[payload.sender_id] = payload
-            self.broadcast(payload, peer, validators=True, clients=False)
+        if sender_id not in self.validators and sender_id != self.node_id:
+            self.validators[sender_id] = peer
+        return True
 
+    def check_election_results(self):
         # if we have received the minimum expected announcements, start a grace period
         if len(self.result_registration) >= ceil(
             len(self.validators) * factor_non_byzantine
         ):
-            # cancel pending tasks to avoid double execution, like a barrier
-            self.cancel_pending_task("election_announce_participation_grace_period")
-            self.cancel_pending_task("election_announce_winner_grace_period")
             # after the grace period, ratify the results
             self.election_phase = "elect_grace"
-            self.register_task(
-                "election_announce_winner_grace_period",
-                self.election_ratify,
-                delay=self.election_winner_grace_period,
-            )
+            self.start_grace_period(self.election_ratify, self.election_winner_grace_period)
 
     def election_ratify(self):
         """If no contradictory results have been received, ratify the election outcome."""
@@ -406,11 +987,11 @@ class Validator(Blockchain):
         #     "elect",
         #     "elect_grace",
         # ), f"{self.election_phase=}"
-        assert self.election_winner_id is not None
+        if self.election_winner_id is None or self.election_phase != "elect_grace":
+            return
 
-        # cancel pending tasks to avoid double execution, like a barrier
-        self.cancel_pending_task("election_announce_participation_grace_period")
-        self.cancel_pending_task("election_announce_winner_grace_period")
+        # cancel the grace periods to avoid double execution, like a barrier
+        self.cancel_grace_period()
         self.election_phase = "ratify"
 
         # for each result received, check if it confirms our findings
@@ -425,14 +1006,15 @@ class Validator(Blockchain):
             ):
                 valid += 1
             else:
-                print(
-                    f" [V{self.node_id}] Election result of {key} does not match ours"
-                )
-                print(
-                    f"Ours: {self.election_round=}, {self.election_winner_id=}, {self.election_random_seed=}, {len(self.validators)=}"
+                self.logger.warning(
+                    "Election result does not match ours",
+                    sender=key,
+                    round=self.election_round,
+                    winner=self.election_winner_id,
+                    seed=self.election_random_seed,
+                    validators=len(self.validators),
+                    theirs=payload,
                 )
-                print("Theirs:")
-                print(payload)
 
         # prepare the variables for a next election
         self.election_phase = "none"
@@ -444,47 +1026,254 @@ class Validator(Blockchain):
 
         # if less than N-f contradictory results are received, a new election must be started
         if valid < ceil(len(self.validators) * factor_non_byzantine):
-            print(
-                f"[V{self.node_id}] Failed to ratify election {valid=} out of {ceil(len(self.validators) * factor_non_byzantine)}"
+            self.logger.warning(
+                "Failed to ratify election",
+                valid=valid,
+                required=ceil(len(self.validators) * factor_non_byzantine),
             )
             self.election_round += 1
             self.election_winner_id = None
             self.start_election()
         else:
-            print(
-                f"[V{self.node_id}] Ratified election: {self.election_winner_id} is leader"
-            )
-            if self.node_id == self.election_winner_id:
+            self.logger.info("Ratified election", leader=self.election_winner_id)
+            if self.leader_mode == "schedule":
+                self.install_leader_schedule()
+            elif self.node_id == self.election_winner_id:
                 self.act_leader()
 
+    def install_leader_schedule(self):
+        """Derives the leaders of the next heights from the stakes and seed of the ratified election."""
+        self.leader_schedule = LeaderSchedule(
+            self.election_stakes,
+            self.election_seed,
+            self.get_block_height() + 1,
+            self.leader_schedule_length,
+        )
+        self.last_block_time = time()
+        self.logger.info(
+            "Installed leader schedule",
+            start=self.leader_schedule.start_height,
+            end=self.leader_schedule.end_height,
+        )
+        self.propose_if_leader()
+
+    def propose_if_leader(self):
+        """Proposes the next blocks the schedule makes us the leader of, as far as the pipeline allows."""
+        while self.leader_schedule is not None and self.can_propose():
+            height = self.get_block_height() + 1
+            if height not in self.leader_schedule:
+                # the schedule ran out, elect the leaders of the next heights
+                self.leader_schedule = None
+                self.start_election()
+                return
+            if self.leader_schedule.leader(height) != self.node_id or len(self.pending_transactions) == 0:
+                return
+            if self.form_block() is None:
+                return
+
+    def check_leader_timeout(self):
+        """Falls back to an election when the scheduled leader does not produce a block."""
+        if self.leader_schedule is None or len(self.pending_transactions) == 0:
+            return
+        if time() - self.last_block_time > leader_timeout:
+            self.logger.warning(
+                "Scheduled leader timed out",
+                height=self.get_block_height() + 1,
+                leader=self.leader_schedule.leader(self.get_block_height() + 1),
+            )
+            self.leader_schedule = None
+            self.start_election()
+
     def finalize_block(self, block: Block):
-        print("Finalizing block")
         self.execute_transactions(block.transactions)
+        self.finalized_height = max(self.finalized_height, block.block_height)
+        self.blocks.mark_finalized(self.finalized_height)
+        if (
+            self.data_dir is not None
+            and self.finalized_height >= self.snapshot_height + self.snapshot_interval
+        ):
+            self.take_snapshot()
 
         # self.check_transactions(block.transactions)
-        print(
-            f"[Node {self.node_id}] Finalized block {block.block_height} with {len(block.transactions)} transactions"
+        self.logger.info(
+            "Finalized block", height=block.block_height, transactions=len(block.transactions)
         )
-        self.active_block_proposal = False
+        self.quorum_blocks.pop(block.block_height, None)
+        self.block_proposers.pop(block.block_height, None)
+        self.last_block_time = time()
+        self.vote_retries = 0
+        if self.leader_schedule is not None:
+            self.propose_if_leader()
+        elif self.proposal_waiting:
+            self.act_leader()
 
     @message_wrapper(Block)
     async def on_block(self, peer: Peer, payload: Block) -> None:
+        sender_id = self.node_id_from_peer(peer)
+        if payload.block_height > self.get_block_height() + 1:
+            # ahead of our chain, keep it until the blocks before it are synced
+            if payload.block_height <= self.get_block_height() + sync_window:
+                self.sync_buffer.setdefault(payload.block_height, payload)
+            self.note_height(sender_id, payload.block_height)
+            return
+        if self.blocks.at_height(payload.block_height) == payload:
+            # a block we already have, re-gossiped by another validator
+            return
         if self.validate_block(payload):
-            if payload not in self.blocks:
-                self.blocks.append(payload)
-
-                for peer in self.validators.values():
-                    self.ez_send(peer, payload)
-
-                # TODO: there might be soft forks.
-                # @TODO: Call block confirmation
-                self.broadcast_block_confirmation(payload)
-            print(
-                f"[Node {self.node_id}] Received block {payload.block_height} ({len(self.blocks)})"
+            if self.blocks.add(payload):
+                if self.vote_mode == "certificate":
+                    # only proposers send blocks, a validator that misses one syncs it when
+                    # the certificate arrives
+                    self.broadcast_block_confirmation(payload, sender_id)
+                else:
+                    self.ez_send_many(self.validators.values(), payload)
+
+                    # TODO: there might be soft forks.
+                    # @TODO: Call block confirmation
+                    self.broadcast_block_confirmation(payload)
+                # votes, or a certificate, may have overtaken the block
+                self.check_block_votes(payload, self.blocks.digest(payload))
+                self.finalize_quorum_blocks()
+            self.logger.debug(
+                "Received block", height=payload.block_height, blocks=len(self.blocks)
             )
+            self.note_height(sender_id, payload.block_height)
+            if self.sync_buffer:
+                self.apply_synced_blocks()
+            # with a pipeline, the leader of the next height need not wait for this one's votes
+            if self.leader_schedule is not None:
+                self.propose_if_leader()
         else:
-            print(
-                f"[Node {self.node_id}] Received invalid block {payload.block_height}"
+            self.logger.info("Received invalid block", height=payload.block_height)
+
+    def note_height(self, node_id: int | None, height: int) -> None:
+        """Records that a validator has the block at height, and catches up if we do not."""
+        if node_id is None:
+            return
+        if height > self.peer_heights.get(node_id, 0):
+            self.peer_heights[node_id] = height
+        self.sync_target = max(self.sync_target, height)
+        if (
+            self.sync_target > self.get_block_height()
+            and not self.sync_requests
+            and not self.sync_scheduled
+        ):
+            # wait a little, the missing blocks may just have been overtaken by this message
+            self.sync_scheduled = True
+            self.register_anonymous_task(
+                "request_blocks", self.request_blocks, delay=sync_request_delay
+            )
+
+    def request_blocks(self) -> None:
+        """Requests the blocks between our chain and the highest known height, in batches.
+
+        Batches are aligned to multiples of sync_batch_size and go to different
+        validators that have them, at most sync_max_requests at once. A batch that
+        is not answered in time is requested again, from another validator if any.
+        """
+        self.sync_scheduled = False
+        height = self.get_block_height()
+        now = time()
+        timed_out: dict[int, int] = {}  # first height: validator id
+        for start, (node_id, requested_at) in list(self.sync_requests.items()):
+            if start + sync_batch_size <= height + 1:
+                del self.sync_requests[start]
+            elif now - requested_at > sync_request_timeout:
+                del self.sync_requests[start]
+                timed_out[start] = node_id
+        if height >= self.sync_target:
+            return
+
+        busy = {node_id for node_id, _ in self.sync_requests.values()}
+        start = height - height % sync_batch_size + 1
+        while start <= self.sync_target and len(self.sync_requests) < sync_max_requests:
+            first = max(start, height + 1)
+            end = min(start + sync_batch_size, self.sync_target + 1)
+            if start not in self.sync_requests and any(
+                h not in self.sync_buffer for h in range(first, end)
+            ):
+                candidates = [
+                    node_id
+                    for node_id in sorted(self.validators)
+                    if self.peer_heights.get(node_id, 0) >= first
+                ]
+                if len(candidates) > 1:
+                    candidates = [c for c in candidates if c != timed_out.get(start)]
+                idle = [c for c in candidates if c not in busy]
+                pool = idle or candidates
+                if not pool:
+                    break  # nobody is known to have these blocks, wait for more votes and blocks
+                node_id = pool[start // sync_batch_size % len(pool)]
+                self.sync_requests[start] = (node_id, now)
+                busy.add(node_id)
+                self.ez_send(self.validators[node_id], GetBlocks(first, end - first))
+                self.logger.debug("Requested blocks", start=first, count=end - first, validator=node_id)
+            start += sync_batch_size
+
+    @message_wrapper(GetBlocks)
+    async def on_get_blocks(self, peer: Peer, payload: GetBlocks) -> None:
+        """Sends the requested blocks that we have, split over messages of a bounded size."""
+        blocks, size = [], 0
+        for height in range(
+            payload.start_height, payload.start_height + min(payload.count, sync_batch_size)
+        ):
+            block = self.blocks.at_height(height)
+            if block is None:
+                break
+            block_size = len(self.blocks.pack(block))
+            if blocks and size + block_size > sync_max_response_bytes:
+                self.ez_send(peer, BlockRange(self.finalized_height, blocks))
+                blocks, size = [], 0
+            blocks.append(block)
+            size += block_size
+        if blocks:
+            self.ez_send(peer, BlockRange(self.finalized_height, blocks))
+
+    @message_wrapper(BlockRange)
+    async def on_block_range(self, peer: Peer, payload: BlockRange) -> None:
+        height = self.get_block_height()
+        for block in payload.blocks:
+            if height < block.block_height <= height + sync_window:
+                self.sync_buffer.setdefault(block.block_height, block)
+        if payload.blocks:
+            self.note_height(self.node_id_from_peer(peer), payload.blocks[-1].block_height)
+        self.sync_finalized_height = max(self.sync_finalized_height, payload.finalized_height)
+        self.apply_synced_blocks()
+        if self.get_block_height() < self.sync_target:
+            # keep the pipeline full: answered batches free up room for the next ones
+            self.request_blocks()
+
+    def apply_synced_blocks(self) -> None:
+        """Adds the buffered blocks that extend our chain, in order.
+
+        Blocks that a validator reported as finalized are finalized here, since their
+        votes were sent before we had them. We vote for the others ourselves.
+        """
+        applied = 0
+        while True:
+            block = self.sync_buffer.pop(self.get_block_height() + 1, None)
+            if block is None:
+                break
+            if not self.validate_block(block):
+                # dropped, its batch is requested again once the request times out
+                self.logger.info("Received invalid block", height=block.block_height)
+                break
+            self.blocks.add(block)
+            applied += 1
+            while self.finalized_height < min(self.sync_finalized_height, self.get_block_height()):
+                finalized = self.blocks.at_height(self.finalized_height + 1)
+                self.block_votes.pop(self.blocks.digest(finalized), None)
+                self.finalize_block(finalized)
+            if block.block_height > self.finalized_height:
+                self.broadcast_block_confirmation(block, self.block_proposer(block.block_height))
+                self.check_block_votes(block, self.blocks.digest(block))
+                self.finalize_quorum_blocks()
+        height = self.get_block_height()
+        for stale in [h for h in self.sync_buffer if h <= height]:
+            del self.sync_buffer[stale]
+        if applied:
+            self.logger.info(
+                "Synced blocks", blocks=applied, height=height, target=self.sync_target
             )
 
     @message_wrapper(Gossip)
@@ -496,14 +1285,17 @@ class Validator(Blockchain):
         # )
         to_gossip = []
         for tx in payload.transactions:
-            if tx not in self.pending_transactions:
-                self.pending_transactions.append(tx)
+            key = transaction_key(tx)
+            self.requested_transactions.pop(key, None)
+            self.transaction_announcers.pop(key, None)
+            if key in self.finalized_transactions:
+                continue
+            if self.pending_transactions.add(tx):
                 to_gossip.append(tx)
 
         # broadcast the gossip
         if len(to_gossip) > 0:
-            gossip_message = Gossip(to_gossip)
-            self.broadcast(gossip_message, peer, validators=True, clients=False)
+            self.gossip_transactions(to_gossip, peer)
 
         # if payload.message_id is None:
         #     print(f"Received Gossip without message ID from {peer}")
@@ -516,6 +1308,112 @@ class Validator(Blockchain):
         #             continue
         #         self.ez_send(val, payload)
 
+    @message_wrapper(Inventory)
+    async def on_inventory(self, peer: Peer, payload: Inventory) -> None:
+        """When transaction ids are announced, request the transactions we do not have yet."""
+        now = time()
+        missing = []
+        for transaction_id in payload.transactions:
+            key = (transaction_id.sender_id, transaction_id.message_id)
+            if (
+                self.pending_transactions.get(key) is not None
+                or key in self.finalized_transactions
+            ):
+                continue
+            # another peer is already sending it, unless that request timed out
+            if now - self.requested_transactions.get(key, 0) < inventory_request_timeout:
+                announcers = self.transaction_announcers.setdefault(key, [])
+                if len(announcers) < inventory_max_announcers and peer not in announcers:
+                    announcers.append(peer)
+                continue
+            self.requested_transactions[key] = now
+            missing.append(transaction_id)
+        if len(missing) > 0:
+            self.ez_send(peer, GetTransactions(missing))
+
+    def retry_transaction_requests(self) -> None:
+        """Requests the transactions that were not delivered in time again, from another announcer.
+
+        A transaction that no other peer announced is forgotten, so peers that never
+        answer do not make the requests grow; it is requested again when it is announced.
+        """
+        now = time()
+        retries: dict[Peer, list[TransactionId]] = defaultdict(list)
+        for key, requested_at in list(self.requested_transactions.items()):
+            if now - requested_at < inventory_request_timeout:
+                continue
+            announcers = self.transaction_announcers.get(key)
+            if (
+                announcers
+                and self.pending_transactions.get(key) is None
+                and key not in self.finalized_transactions
+            ):
+                self.requested_transactions[key] = now
+                retries[announcers.pop(0)].append(TransactionId(*key))
+            else:
+                del self.requested_transactions[key]
+                self.transaction_announcers.pop(key, None)
+        for peer, transaction_ids in retries.items():
+            for chunk in list_chunks(transaction_ids):
+                self.ez_send(peer, GetTransactions(chunk))
+
+    @message_wrapper(GetTransactions)
+    async def on_get_transactions(self, peer: Peer, payload: GetTransactions) -> None:
+        """When a peer requests announced transactions, send it the ones we have."""
+        transactions = []
+        for transaction_id in payload.transactions:
+            tx = self.pending_transactions.get(
+                (transaction_id.sender_id, transaction_id.message_id)
+            )
+            if tx is not None:
+                transactions.append(tx)
+        for chunk in list_chunks(transactions):
+            self.ez_send(peer, Gossip(chunk))
+
+    def mempool_sketch(self, cells_per_hash: int) -> MempoolSketch:
+        table = InvertibleBloomLookupTable.from_keys(
+            self.pending_transactions.keys(), cells_per_hash
+        )
+        return MempoolSketch(table.to_bytes())
+
+    def reconcile_mempool(self):
+        """Sends a sketch of our pending transactions to a random validator, to recover lost gossip."""
+        if len(self.validators) == 0:
+            return
+        peer = self.reconciliation_random.choice(list(self.validators.values()))
+        self.ez_send(peer, self.mempool_sketch(reconciliation_cells_per_hash))
+
+    @message_wrapper(MempoolSketch)
+    async def on_mempool_sketch(self, peer: Peer, payload: MempoolSketch) -> None:
+        """When a mempool sketch is received, exchange only the transactions that differ."""
+        try:
+            theirs = InvertibleBloomLookupTable.from_bytes(payload.cells)
+        except ValueError:
+            self.logger.warning("Received invalid mempool sketch", size=len(payload.cells))
+            return
+        ours = InvertibleBloomLookupTable.from_keys(
+            self.pending_transactions.keys(), theirs.cells_per_hash
+        )
+        only_theirs, only_ours, complete = theirs.subtract(ours).decode()
+        if not complete:
+            # too many differences for this sketch size, answer with a larger sketch of our own
+            if theirs.cells_per_hash * 2 <= reconciliation_max_cells_per_hash:
+                self.ez_send(peer, self.mempool_sketch(theirs.cells_per_hash * 2))
+            return
+
+        # send what they miss, and request what we miss
+        transactions = [self.pending_transactions.get(key) for key in only_ours]
+        for chunk in list_chunks(transactions):
+            self.ez_send(peer, Gossip(chunk))
+        now = time()
+        missing = []
+        for key in only_theirs:
+            if key not in self.finalized_transactions:
+                self.requested_transactions[key] = now
+                missing.append(TransactionId(*key))
+        for chunk in list_chunks(missing):
+            self.ez_send(peer, GetTransactions(chunk))
+
     @message_wrapper(Announcement)
     async def on_announcement(self, peer: Peer, payload: Announcement) -> None:
         """When an announcement message is received, register it as a fellow validator or client."""
@@ -529,6 +1427,15 @@ class Validator(Blockchain):
                 # broadcast the announcement so other validators get the client as well
                 self.broadcast(payload, peer, validators=True, clients=False)
         elif sender_id != self.node_id:
+            if sender_id not in self.validators:
+                # the validator set changed, so the stakes of the schedule are outdated
+                self.leader_schedule = None
+                self.probe([peer])  # rather than waiting for the next probes, the next election may be close
+                if self.blocks.tip is not None:
+                    # a validator that joined late or restarted: introduce ourselves and our tip,
+                    # from which it notices how far behind it is
+                    self.ez_send(peer, Announcement(self.node_id, False))
+                    self.ez_send(peer, self.blocks.tip)
             self.validators[sender_id] = peer
 
         # create the initial transaction
@@ -545,8 +1452,10 @@ class Validator(Blockchain):
             # self.init_transaction()
 
         # print(f'{len(self.validators) + len(self.clients) >= len(self.nodes)}')
-        print(
-            f"Announcement received: peer {peer} is {'client' if payload.is_client else 'validator'}"
+        self.logger.debug(
+            "Received announcement",
+            sender=payload.sender_id,
+            role="client" if payload.is_client else "validator",
         )
 
     def is_new_transaction(self, transaction: TransactionBody) -> bool:
@@ -561,7 +1470,7 @@ class Validator(Blockchain):
             return False
 
         # least likely: a transaction has already been finalized
-        if transaction in self.finalized_transactions:
+        if transaction_key(transaction) in self.finalized_transactions:
             return False
 
         return True
@@ -573,50 +1482,160 @@ class Validator(Blockchain):
             # print(f"[Validator {self.node_id}] got TX from {self.node_id_from_peer(peer)}")
 
             if self.is_new_transaction(payload):
-                self.buffered_transactions.append(payload)
+                self.buffered_transactions.add(payload)
 
     @message_wrapper(BlockVote)
     async def on_block_vote(self, peer: Peer, payload: BlockVote) -> None:
+        sender_id = self.node_id_from_peer(peer)
+        if sender_id not in self.validators:
+            # only validators vote, a vote from a client or an unknown peer would skew the quorum
+            self.logger.debug("Received vote from a non-validator", sender=sender_id)
+            return
+        if payload.block_height <= self.finalized_height:
+            # a late or repeated vote, counting it could finalize the block a second time
+            self.answer_late_vote(peer, payload)
+            return
         # Find corresponding block
-        block = [
-            block for block in self.blocks if block.block_height == payload.block_height
-        ]
-        if len(block) == 0:
-            print(
-                f"[Node {self.node_id}] Received invalid vote for block {payload.block_height} 1"
-            )
+        block = self.blocks.at_height(payload.block_height)
+        if block is None:
+            self.logger.debug("Received vote for unknown block", height=payload.block_height)
+            if payload.block_height <= self.get_block_height() + sync_window:
+                # keep the vote until the block is synced, it is not sent again
+                self.block_votes[payload.block_hash].add(sender_id)
+                self.note_height(sender_id, payload.block_height)
             return
-        block = block[0]
 
         # Check hash
-        block_package = default_serializer.pack("payload", block)
-        block_hash = sha256(block_package).digest()
-        if block_hash != payload.block_hash:
-            print(
-                f"[Node {self.node_id}] Received invalid vote for block {payload.block_height} 2"
+        block = self.blocks.with_hash(payload.block_hash)
+        if block is None or block.block_height != payload.block_height:
+            self.logger.debug(
+                "Received vote for unknown block hash", height=payload.block_height
             )
             return
 
         # Record vote
-        self.block_votes[payload.block_hash].add(self.node_id_from_peer(peer))
-        print(f"[Node {self.node_id}] Received vote for block {payload.block_height}")
+        self.block_votes[payload.block_hash].add(sender_id)
+        self.logger.debug("Received vote", height=payload.block_height)
+        self.check_block_votes(block, payload.block_hash)
 
+    def check_block_votes(self, block: Block, block_hash: bytes) -> None:
         # Check for majority votes (two thirds).
-        if (
-            len(self.block_votes[payload.block_hash])
-            >= 2 * (len(self.validators) + 1) / 3
-        ):
-            self.finalize_block(block)
-            self.block_votes.pop(payload.block_hash)
+        if len(self.block_votes[block_hash]) >= 2 * (len(self.validators) + 1) / 3:
+            voters = self.block_votes.pop(block_hash)
+            if block.block_height > self.finalized_height:
+                if (
+                    self.vote_mode == "certificate"
+                    and self.block_proposer(block.block_height) == self.node_id
+                ):
+                    # only the proposer certifies, other validators that counted a quorum
+                    # from votes that were sent to everyone finalize on their own
+                    self.send_vote_certificate(block.block_height, block_hash, voters)
+                self.quorum_blocks[block.block_height] = block_hash
+                self.finalize_quorum_blocks()
+
+    def send_vote_certificate(self, height: int, block_hash: bytes, voters: set[int]) -> None:
+        certificate = VoteCertificate(height, block_hash, pack_node_ids(sorted(voters)))
+        self.vote_certificates[height] = (certificate, time())
+        while len(self.vote_certificates) > vote_certificate_history:
+            del self.vote_certificates[next(iter(self.vote_certificates))]
+        self.ez_send_many(self.validators.values(), certificate)
+
+    def answer_late_vote(self, peer: Peer, payload: BlockVote) -> None:
+        """Sends our certificate again to a validator that voted again, it must have missed it."""
+        sent = self.vote_certificates.get(payload.block_height)
+        if sent is None or sent[0].block_hash != payload.block_hash:
+            return
+        certificate, sent_at = sent
+        # votes sent before the certificate arrived are late too, but not sent again
+        retry_delay = self.round_trip_timeout(
+            self.validators.values(), block_vote_timeout, block_vote_round_trips
+        )
+        if time() - sent_at >= retry_delay / 2:
+            self.ez_send(peer, certificate)
+
+    @message_wrapper(VoteCertificate)
+    async def on_vote_certificate(self, peer: Peer, payload: VoteCertificate) -> None:
+        """Finalizes a block on the quorum of votes that its proposer collected.
+
+        Certificates carry no signatures of the voters, so they are only accepted
+        from the scheduled or elected proposer of their height, whose signature
+        ipv8 checks on every message.
+        """
+        if payload.block_height <= self.finalized_height:
+            return
+        sender_id = self.node_id_from_peer(peer)
+        if sender_id is None or sender_id != self.block_proposer(payload.block_height):
+            self.logger.warning(
+                "Received vote certificate from a validator that did not propose the block",
+                height=payload.block_height,
+                sender=sender_id,
+                proposer=self.block_proposer(payload.block_height),
+            )
+            return
+        try:
+            voters = [
+                node_id
+                for node_id in set(unpack_node_ids(payload.voters))
+                if node_id in self.validators or node_id == self.node_id
+            ]
+        except ValueError:
+            self.logger.warning(
+                "Received invalid vote certificate",
+                height=payload.block_height,
+                size=len(payload.voters),
+            )
+            return
+        if len(voters) < 2 * (len(self.validators) + 1) / 3:
+            self.logger.warning(
+                "Received vote certificate without a quorum",
+                height=payload.block_height,
+                voters=len(voters),
+                validators=len(self.validators) + 1,
+            )
+            return
+        block = self.blocks.with_hash(payload.block_hash)
+        if block is not None and block.block_height != payload.block_height:
+            self.logger.warning(
+                "Received vote certificate for a block at another height",
+                height=payload.block_height,
+                block_height=block.block_height,
+            )
+            return
+        self.block_votes.pop(payload.block_hash, None)
+        self.quorum_blocks[payload.block_height] = payload.block_hash
+        if block is None:
+            # the block was lost or is still on its way, it is synced if it does not arrive
+            self.note_height(sender_id, payload.block_height)
+            return
+        self.finalize_quorum_blocks()
+
+    def finalize_quorum_blocks(self) -> None:
+        """Finalizes the blocks with a quorum in height order, a block waits for the heights below it.
+
+        With a pipeline, the votes for a height can complete before those of the height below.
+        A quorum for a block in our chain also finalizes the unfinalized blocks below it: its
+        voters only voted for it on top of the same chain, so the heights whose own votes we
+        missed do not stall us once the other validators ignore late votes for them.
+        """
+        for height in sorted(self.quorum_blocks):
+            block_hash = self.quorum_blocks.get(height)
+            if block_hash is None or height <= self.finalized_height:
+                continue
+            block = self.blocks.with_hash(block_hash)
+            if block is None or block.block_height != height:
+                return
+            while self.finalized_height < height:
+                self.finalize_block(self.blocks.at_height(self.finalized_height + 1))
 
     def broadcast(self, payload, originator: Peer, validators=True, clients=True):
         """Utility function to broadcast a message to a selection of nodes."""
+        # use a set of peers to make sure we don't send to the same peers,
+        # the payload is serialized once for all of them
+        targets = set()
         if validators:
-            # use set of validator peers to make sure we don't send to the same peers
-            for validator in set(self.validators.values()):
-                if validator is not originator and validator is not self.my_peer:
-                    self.ez_send(validator, payload)
+            targets.update(self.validators.values())
         if clients:
-            for client in set(self.clients.values()):
-                if client is not originator and client is not self.my_peer:
-                    self.ez_send(client, payload)
+            targets.update(self.clients.values())
+        targets.discard(originator)
+        targets.discard(self.my_peer)
+        self.ez_send_many(targets, payload)
@@ -0,0 +1,111 @@
+"""Benchmark of the election message count and duration, per election mode and timeout mode.
+
+Runs one election among a clique of validators in the in-process simulator, in
+both election modes, and counts the datagrams and bytes of the election
+messages that all validators sent. With fixed timeouts, the grace periods of an
+election take seconds; adaptive timeouts derive them from the probed round-trip
+times. Run from the ``src`` directory::
+
+    python -m benchmarks.election --validators 4 8 16 32
+    python -m benchmarks.election --validators 8 --latency 0.1 --jitter 0.05 --timeouts adaptive
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from time import perf_counter
+
+from algorithms.validator import Validator, election_modes
+from da_types import timeout_modes
+from simulate import SimulatedNetwork, Simulation
+from topology import blockchain_topology
+
+election_messages = (
+    "AnnounceConcensusParticipation",
+    "AnnounceConcensusWinner",
+    "ElectionParticipations",
+    "ElectionResults",
+)
+
+
+async def run_election(num_validators: int, mode: str, timeout_mode: str, args) -> dict:
+    network = SimulatedNetwork(args.latency, args.jitter, seed=args.seed)
+    simulation = Simulation(network)
+    settings = {
+        "election_mode": mode,
+        "timeout_mode": timeout_mode,
+        "metrics": True,
+    }
+    topology = blockchain_topology(num_validators, 0)
+    await simulation.add_topology(topology, dict.fromkeys(topology, Validator), settings)
+    await simulation.start()
+    validators = list(simulation.communities.values())
+    while any(v.time_to_start is None for v in validators):
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(args.settle)  # let the announcements and round-trip probes settle
+
+    start = perf_counter()
+    validators[0].start_election()
+    # an election is over once every validator ratified it and moved on to the next round
+    while any(v.election_round < 2 or v.election_phase != "none" for v in validators):
+        if perf_counter() - start > args.timeout:
+            break
+        await asyncio.sleep(0.01)
+    duration = perf_counter() - start
+
+    datagrams = bytes_sent = 0
+    for validator in validators:
+        for name, stats in validator.metrics.messages.items():
+            if name in election_messages:
+                datagrams += stats.sent
+                bytes_sent += stats.bytes_out
+    leaders = {v.election_winner_id for v in validators}
+    await simulation.stop()
+    return {
+        "validators": num_validators,
+        "mode": mode,
+        "timeouts": timeout_mode,
+        "datagrams": datagrams,
+        "bytes": bytes_sent,
+        "duration_s": round(duration, 3),
+        "agreed": len(leaders) == 1 and None not in leaders,
+    }
+
+
+async def main(args) -> None:
+    results = []
+    for num_validators in args.validators:
+        for mode in election_modes:
+            for timeout_mode in args.timeouts:
+                result = await run_election(num_validators, mode, timeout_mode, args)
+                results.append(result)
+                print(
+                    f"{num_validators:4d} validators, {mode:9s} {timeout_mode:8s}:"
+                    f" {result['datagrams']:7d} datagrams {result['bytes']:9d} bytes"
+                    f"  {result['duration_s']:6.3f} s"
+                    f"{'' if result['agreed'] else '  (no agreement)'}"
+                )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="election",
+        description="Election messages and duration per election mode and timeout mode.",
+    )
+    parser.add_argument("--validators", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument(
+        "--timeouts", choices=timeout_modes, nargs="+", default=list(timeout_modes)
+    )
+    parser.add_argument(
+        "--settle", type=float, default=0.5, help="seconds between the start and the election"
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for an election")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="write the results as JSON")
+    asyncio.run(main(parser.parse_args()))
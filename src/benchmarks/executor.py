@@ -0,0 +1,91 @@
+"""Benchmark of executing one block of transfers against account balances.
+
+Compares the per-transaction loop over a ``defaultdict`` that the validators
+used before with the batch ``AccountBalances.execute``. Run from the ``src``
+directory::
+
+    python -m benchmarks.executor
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from collections import defaultdict
+from time import perf_counter
+
+from algorithms import execution
+from algorithms.execution import AccountBalances
+
+
+def per_transaction_loop(balances, senders, targets, amounts) -> None:
+    for sender, target, amount in zip(senders, targets, amounts):
+        if balances[sender] >= amount:
+            balances[sender] -= amount
+            balances[target] += amount
+
+
+def make_block(size: int, accounts: int, seed: int):
+    rng = random.Random(seed)
+    senders = [rng.randrange(accounts) for _ in range(size)]
+    targets = [rng.randrange(accounts) for _ in range(size)]
+    amounts = [rng.randint(1, 100) for _ in range(size)]
+    return senders, targets, amounts
+
+
+def main(args) -> None:
+    results = []
+    for balance in args.balances:
+        for size in args.sizes:
+            senders, targets, amounts = make_block(size, args.accounts, args.seed)
+
+            balances = defaultdict(lambda: balance)
+            start = perf_counter()
+            per_transaction_loop(balances, senders, targets, amounts)
+            loop_time = perf_counter() - start
+
+            batch = AccountBalances(balance)
+            start = perf_counter()
+            executed = batch.execute(senders, targets, amounts)
+            batch_time = perf_counter() - start
+
+            assert all(batch[a] == balances[a] for a in range(args.accounts))
+            results.append(
+                {
+                    "transactions": size,
+                    "starting_balance": balance,
+                    "overdrafts": executed.count(False),
+                    "loop_ms": round(loop_time * 1e3, 2),
+                    "batch_ms": round(batch_time * 1e3, 2),
+                    "speedup": round(loop_time / batch_time, 2),
+                    "vectorized": execution.np is not None,
+                }
+            )
+            print(
+                f"{size:8d} transactions, balance {balance:9d}: loop {loop_time * 1e3:9.2f} ms"
+                f"  batch {batch_time * 1e3:9.2f} ms  ({executed.count(False)} overdrafts)"
+            )
+    if execution.np is None:
+        print("numpy is not installed, the batch executor ran sequentially")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="executor",
+        description="Per-transaction versus batch execution of a block.",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument(
+        "--balances",
+        type=int,
+        nargs="+",
+        default=[1_000_000, 1000],
+        help="starting balances to run with, lower values cause more overdrafts",
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="write the results as JSON")
+    main(parser.parse_args())
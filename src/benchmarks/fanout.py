@@ -0,0 +1,91 @@
+"""Micro-benchmark of broadcasting one payload to a growing number of peers.
+
+Compares sending with one ``ez_send`` per peer to the serialize-once
+``Blockchain.ez_send_many``. Run from the ``src`` directory::
+
+    python -m benchmarks.fanout
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+from time import perf_counter
+
+from ipv8.community import CommunitySettings
+from ipv8.keyvault.crypto import default_eccrypto
+from ipv8.peer import Peer
+from ipv8.peerdiscovery.network import Network
+
+from algorithms.messages import Gossip, TransactionBody
+from benchmarks.null_endpoint import NullEndpoint
+from da_types import Blockchain
+
+
+def make_community(curve: str) -> Blockchain:
+    endpoint = NullEndpoint()
+    my_peer = Peer(default_eccrypto.generate_key(curve), endpoint.get_address())
+    return Blockchain(
+        CommunitySettings(my_peer=my_peer, endpoint=endpoint, network=Network())
+    )
+
+
+def make_peers(n: int) -> list[Peer]:
+    return [
+        Peer(default_eccrypto.generate_key("curve25519"), ("127.0.0.1", 10000 + i))
+        for i in range(n)
+    ]
+
+
+def time_per_broadcast(send, repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        send()
+    return (perf_counter() - start) / repeat
+
+
+async def main(args) -> None:
+    community = make_community(args.curve)
+    payload = Gossip([TransactionBody(i, i + 1, 10, i) for i in range(args.transactions)])
+    results = []
+    for n in args.peers:
+        peers = make_peers(n)
+
+        def per_peer():
+            for peer in peers:
+                community.ez_send(peer, payload)
+
+        def fan_out():
+            community.ez_send_many(peers, payload)
+
+        per_peer_time = time_per_broadcast(per_peer, args.repeat)
+        fan_out_time = time_per_broadcast(fan_out, args.repeat)
+        results.append(
+            {
+                "peers": n,
+                "per_peer_us": round(per_peer_time * 1e6, 1),
+                "fan_out_us": round(fan_out_time * 1e6, 1),
+                "speedup": round(per_peer_time / fan_out_time, 2),
+            }
+        )
+        print(
+            f"{n:5d} peers: ez_send {per_peer_time * 1e6:10.1f} us"
+            f"  ez_send_many {fan_out_time * 1e6:10.1f} us"
+        )
+    await community.unload()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="fanout",
+        description="Per-broadcast CPU cost as a function of the number of peers.",
+    )
+    parser.add_argument("--peers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--transactions", type=int, default=20, help="transactions per Gossip")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--curve", type=str, default="medium", help="key curve, as in run.py")
+    parser.add_argument("--output", type=str, default=None, help="write the results as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,33 @@
+from ipv8.messaging.interfaces.endpoint import Endpoint
+
+
+class NullEndpoint(Endpoint):
+    """Endpoint that drops every packet, while counting what would have been sent."""
+
+    def __init__(self, address=("127.0.0.1", 9999)) -> None:
+        super().__init__()
+        self.address = address
+        self.packets = 0
+        self.bytes_up = 0
+
+    def assert_open(self) -> None:
+        pass
+
+    def is_open(self) -> bool:
+        return True
+
+    def get_address(self):
+        return self.address
+
+    def send(self, socket_address, packet: bytes) -> None:
+        self.packets += 1
+        self.bytes_up += len(packet)
+
+    async def open(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def reset_byte_counters(self) -> None:
+        self.bytes_up = 0
@@ -0,0 +1,119 @@
+"""Benchmark of restoring the account state from a snapshot versus replaying the chain.
+
+Builds a chain of random transfers in a block store on disk, snapshots the state
+at the tip, and measures the snapshot size, the time to write it and the time to
+restore it, against executing every block from genesis. Run from the ``src``
+directory::
+
+    python -m benchmarks.snapshot
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+
+from algorithms.block_store import BlockStore
+from algorithms.execution import AccountBalances
+from algorithms.messages import Block, TransactionBody
+from algorithms.snapshot import pack_snapshot, read_snapshot, write_snapshot
+
+
+def build_chain(path: str, blocks: int, width: int, accounts: int, seed: int) -> BlockStore:
+    rng = random.Random(seed)
+    store = BlockStore(path)
+    message_ids = [0] * accounts
+    # the first blocks fund every account with an init transaction, the others are random transfers
+    funding = [TransactionBody(-1, account, 1000, account) for account in range(accounts)]
+    for height in range(1, blocks + 1):
+        transactions, funding = funding[:width], funding[width:]
+        while len(transactions) < width:
+            sender = rng.randrange(accounts)
+            transactions.append(
+                TransactionBody(sender, rng.randrange(accounts), rng.randint(1, 100), message_ids[sender])
+            )
+            message_ids[sender] += 1
+        store.add(Block(height, store.tip_hash, height, transactions))
+    store.mark_finalized(blocks)
+    store.sync()
+    return store
+
+
+def replay(store: BlockStore, first: int, last: int, balances: AccountBalances, finalized: set) -> None:
+    for height in range(first, last + 1):
+        transactions = store.at_height(height).transactions
+        balances.execute(
+            [t.sender_id for t in transactions],
+            [t.target_id for t in transactions],
+            [t.amount for t in transactions],
+        )
+        finalized.update((t.sender_id, t.message_id) for t in transactions)
+
+
+def main(args) -> None:
+    results = []
+    for blocks in args.blocks:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "validator0")
+            store = build_chain(path, blocks, args.width, args.accounts, args.seed)
+
+            balances, finalized = AccountBalances(0), set()
+            start = perf_counter()
+            replay(store, 1, blocks, balances, finalized)
+            replay_time = perf_counter() - start
+
+            snapshot_height = blocks - args.tail
+            expected = AccountBalances(0), set()
+            replay(store, 1, snapshot_height, *expected)
+            start = perf_counter()
+            data = pack_snapshot(
+                snapshot_height, store.digest(store.at_height(snapshot_height)), *expected
+            )
+            write_snapshot(path + ".snapshot", data)
+            write_time = perf_counter() - start
+
+            start = perf_counter()
+            snapshot = read_snapshot(path + ".snapshot")
+            replay(store, snapshot_height + 1, blocks, snapshot.balances, snapshot.finalized_transactions)
+            restore_time = perf_counter() - start
+            store.close()
+
+            assert dict(snapshot.balances.items()) == dict(balances.items())
+            assert snapshot.finalized_transactions == finalized
+            results.append(
+                {
+                    "blocks": blocks,
+                    "transactions": blocks * args.width,
+                    "snapshot_bytes": snapshot.size,
+                    "write_ms": round(write_time * 1e3, 2),
+                    "restore_ms": round(restore_time * 1e3, 2),
+                    "replay_ms": round(replay_time * 1e3, 2),
+                    "speedup": round(replay_time / restore_time, 2),
+                }
+            )
+            print(
+                f"{blocks:8d} blocks: snapshot {snapshot.size:10d} bytes, write {write_time * 1e3:8.2f} ms"
+                f"  restore {restore_time * 1e3:8.2f} ms  replay from genesis {replay_time * 1e3:9.2f} ms"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="snapshot",
+        description="Restoring the account state from a snapshot versus replaying the chain.",
+    )
+    parser.add_argument("--blocks", type=int, nargs="+", default=[1000, 10_000])
+    parser.add_argument("--width", type=int, default=20, help="transactions per block, at most 255")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument(
+        "--tail", type=int, default=50, help="blocks after the snapshot that are replayed on restore"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="write the results as JSON")
+    main(parser.parse_args())
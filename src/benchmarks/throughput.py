@@ -0,0 +1,218 @@
+"""End-to-end throughput and finality-latency benchmark of validators and clients.
+
+Runs the blockchain protocol in the in-process simulator for every combination
+of the parameter grid, and reports per run: finalized transactions per second,
+the p50/p95/p99 latency from ``Client.send_amount`` until the sending client
+sees the transaction finalized, messages and bytes per finalized transaction,
+and the duration of elections. Run from the ``src`` directory::
+
+    python -m benchmarks.throughput --validators 4 8 --rates 1 4 --output results.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import subprocess
+from time import perf_counter
+
+from algorithms.client import Client, TransactionHistory
+from algorithms.validator import Validator
+from simulate import SimulatedNetwork, Simulation
+from topology import blockchain_topology
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    """The q-th percentile (0-100) with linear interpolation, None without values."""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class LatencyHistory(TransactionHistory):
+    """Client history that measures how long our own transactions took to be finalized."""
+
+    def __init__(self, node_id: int, retention: int, sent_at: dict, latencies: list) -> None:
+        super().__init__(node_id, retention)
+        self.sent_at = sent_at
+        self.latencies = latencies
+
+    def add(self, transaction) -> None:
+        super().add(transaction)
+        sent_at = self.sent_at.pop((transaction.sender_id, transaction.message_id), None)
+        if sent_at is not None:
+            self.latencies.append(perf_counter() - sent_at)
+
+
+class MeasuredClient(Client):
+    """Client that sends at a fixed rate, and records the finality latency of what it sends."""
+
+    def __init__(self, settings) -> None:
+        super().__init__(settings)
+        self.tx_rate = settings.tx_rate
+        self.sent_at: dict[tuple[int, int], float] = {}
+        self.latencies: list[float] = []
+
+    def on_start(self):
+        super().on_start()
+        self.history = LatencyHistory(
+            self.node_id, self.history_retention, self.sent_at, self.latencies
+        )
+        self.replace_task("random_tx", self.send_amount, delay=1, interval=1 / self.tx_rate)
+
+    def send_amount(self, target_id: int = None, amount: int = None):
+        message_id = self.send_counter
+        super().send_amount(target_id, amount)
+        if self.send_counter > message_id:
+            self.sent_at[(self.node_id, message_id)] = perf_counter()
+
+
+class MeasuredValidator(Validator):
+    """Validator that records how long each election it takes part in lasts."""
+
+    def __init__(self, settings) -> None:
+        super().__init__(settings)
+        self.election_started: float | None = None
+        self.election_durations: list[float] = []
+
+    def election_announce(self, origin_id: int):
+        if self.election_started is None:
+            self.election_started = perf_counter()
+        super().election_announce(origin_id)
+
+    def election_ratify(self):
+        if self.election_started is not None:
+            self.election_durations.append(perf_counter() - self.election_started)
+            self.election_started = None
+        super().election_ratify()
+
+
+async def run_once(validators: int, clients: int, tx_rate: float, width: int, args) -> dict:
+    network = SimulatedNetwork(args.latency, args.jitter, args.loss, args.seed)
+    simulation = Simulation(network)
+    topology = blockchain_topology(validators, clients)
+    client_ids = list(range(validators, validators + clients))
+    settings = {
+        "gossip_mode": args.gossip,
+        "election_mode": args.election,
+        "leader_mode": args.leaders,
+        "pipeline_depth": args.pipeline,
+        "vote_mode": args.votes,
+        "client_ids": client_ids,
+        "block_width": width or None,
+        "block_ordering": args.block_order,
+        "tx_rate": tx_rate,
+    }
+    algorithms = {
+        node_id: MeasuredClient if node_id in client_ids else MeasuredValidator
+        for node_id in topology
+    }
+    await simulation.add_topology(topology, algorithms, settings)
+    await simulation.start()
+    await simulation.wait(args.duration)
+    await simulation.stop()
+
+    nodes = simulation.communities
+    finalized = sum(1 for key in nodes[0].finalized_transactions if key[0] != -1)
+    latencies = [latency for c in client_ids for latency in nodes[c].latencies]
+    elections = [d for v in range(validators) for d in nodes[v].election_durations]
+    builders = [nodes[v].block_builder for v in range(validators)]
+    blocks_built = sum(builder.blocks_built for builder in builders)
+    return {
+        "validators": validators,
+        "clients": clients,
+        "tx_rate": tx_rate,
+        "block_width": width,
+        "duration": args.duration,
+        "blocks": nodes[0].finalized_height,
+        "blocks_per_second": nodes[0].finalized_height / args.duration,
+        "block_fill": sum(b.total_fill for b in builders) / blocks_built if blocks_built else None,
+        "finalized_transactions": finalized,
+        "tps": finalized / args.duration,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "messages_per_transaction": network.packets / finalized if finalized else None,
+        "bytes_per_transaction": network.bytes / finalized if finalized else None,
+        "elections": len(elections),
+        "election_duration_p50": percentile(elections, 50),
+        "election_duration_max": max(elections, default=None),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args) -> None:
+    runs = []
+    grid = itertools.product(args.validators, args.clients, args.rates, args.block_widths)
+    for validators, clients, tx_rate, width in grid:
+        result = await run_once(validators, clients, tx_rate, width, args)
+        runs.append(result)
+        print(
+            f"V={validators:3d} C={clients:3d} rate={tx_rate:5.1f} width={width:4d}:"
+            f" {result['tps']:7.2f} tps, {result['blocks_per_second']:5.2f} blocks/s,"
+            f" fill {result['block_fill']},"
+            f" p50 latency {result['latency_p50']},"
+            f" {result['messages_per_transaction']} msgs/tx"
+        )
+    report = {
+        "commit": git_commit(),
+        "settings": {
+            "duration": args.duration,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "loss": args.loss,
+            "gossip": args.gossip,
+            "election": args.election,
+            "leaders": args.leaders,
+            "pipeline": args.pipeline,
+            "votes": args.votes,
+            "block_order": args.block_order,
+        },
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="throughput",
+        description="Throughput and finality latency of the validator/client protocol.",
+    )
+    parser.add_argument("--validators", type=int, nargs="+", default=[4])
+    parser.add_argument("--clients", type=int, nargs="+", default=[3])
+    parser.add_argument("--rates", type=float, nargs="+", default=[1.0], help="transactions per second per client")
+    parser.add_argument(
+        "--block-widths", type=int, nargs="+", default=[5], help="transaction caps, 0 for none"
+    )
+    parser.add_argument("--votes", choices=["broadcast", "certificate"], default="broadcast")
+    parser.add_argument("--block-order", choices=["fifo", "nonce", "amount"], default="fifo")
+    parser.add_argument("--duration", type=float, default=60, help="seconds per run")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--gossip", choices=["flood", "inventory"], default="flood")
+    parser.add_argument("--election", choices=["flood", "aggregate"], default="flood")
+    parser.add_argument("--leaders", choices=["election", "schedule"], default="election")
+    parser.add_argument(
+        "--pipeline", type=int, default=1, help="unfinalized heights a leader may propose on top of"
+    )
+    parser.add_argument("--output", type=str, default=None, help="write the report as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,89 @@
+"""Benchmark of the block and vote messages per finalized block, broadcast votes versus certificates.
+
+Runs validators and clients in the in-process simulator, in both vote modes,
+and counts the datagrams and bytes of the Block, BlockVote and VoteCertificate
+messages that all validators sent, per block that every validator finalized.
+Run from the ``src`` directory::
+
+    python -m benchmarks.votes --validators 4 8 16
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+
+from algorithms.client import Client
+from algorithms.validator import Validator, vote_modes
+from simulate import SimulatedNetwork, Simulation
+from topology import blockchain_topology
+
+block_messages = ("Block", "BlockVote", "VoteCertificate")
+
+
+async def run_votes(num_validators: int, mode: str, args) -> dict:
+    network = SimulatedNetwork(args.latency, args.jitter, args.loss, seed=args.seed)
+    simulation = Simulation(network)
+    topology = blockchain_topology(num_validators, args.clients)
+    client_ids = list(range(num_validators, num_validators + args.clients))
+    settings = {
+        "vote_mode": mode,
+        "leader_mode": "schedule",
+        "client_ids": client_ids,
+        "metrics": True,
+    }
+    algorithms = {node_id: Client if node_id in client_ids else Validator for node_id in topology}
+    await simulation.add_topology(topology, algorithms, settings)
+    await simulation.start()
+    await simulation.wait(args.duration)
+
+    validators = [simulation.communities[node_id] for node_id in range(num_validators)]
+    blocks = min(v.finalized_height for v in validators)
+    datagrams = bytes_sent = 0
+    for validator in validators:
+        for name, stats in validator.metrics.messages.items():
+            if name in block_messages:
+                datagrams += stats.sent
+                bytes_sent += stats.bytes_out
+    digests = {v.blocks.digest(v.blocks.at_height(blocks)) for v in validators if blocks}
+    await simulation.stop()
+    return {
+        "validators": num_validators,
+        "mode": mode,
+        "blocks": blocks,
+        "datagrams_per_block": round(datagrams / blocks, 1) if blocks else None,
+        "bytes_per_block": round(bytes_sent / blocks) if blocks else None,
+        "agreed": len(digests) <= 1,
+    }
+
+
+async def main(args) -> None:
+    results = []
+    for num_validators in args.validators:
+        for mode in vote_modes:
+            result = await run_votes(num_validators, mode, args)
+            results.append(result)
+            print(
+                f"{num_validators:4d} validators, {mode:11s}: {result['blocks']:4d} blocks,"
+                f" {result['datagrams_per_block']} datagrams and {result['bytes_per_block']} bytes"
+                f" per block{'' if result['agreed'] else '  (no agreement)'}"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="votes",
+        description="Block and vote messages per finalized block, broadcast votes versus certificates.",
+    )
+    parser.add_argument("--validators", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--clients", type=int, default=3)
+    parser.add_argument("--duration", type=float, default=30, help="seconds per run")
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--jitter", type=float, default=0.005)
+    parser.add_argument("--loss", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="write the results as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -1,22 +1,178 @@
 from __future__ import annotations
 
-import random
+import ipaddress
+import struct
 import typing
-from asyncio import Event
-from typing import Dict, List, Tuple, Callable
+from asyncio import Event, sleep
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from functools import wraps
+from time import perf_counter, perf_counter_ns
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, Callable
 from ipv8.community import Community, CommunitySettings
 from ipv8.lazy_community import lazy_wrapper
+from ipv8.messaging.payload_dataclass import overwrite_dataclass
 from ipv8.messaging.serialization import Payload
 from ipv8.types import Peer, LazyWrappedHandler, MessageHandlerFunction
 
+from metrics import MessageMetrics
+from node_logging import NodeLogger
+
 DataclassPayload = typing.TypeVar("DataclassPayload")
 AnyPayload = typing.Union[Payload, DataclassPayload]
 
+first_walk_delay = 0.25  # seconds before the first re-walk to unreached neighbours, doubled every time
+max_walk_delay = 4.0
+barrier_resend_interval = 2.0  # seconds between resends of the ready set while waiting at the barrier
+# "fixed" waits the constants of the protocols, "adaptive" derives the waits from measured round trips
+timeout_modes = ("fixed", "adaptive")
+probe_interval = 1.0  # seconds between round-trip probes to every neighbour, with adaptive timeouts
+min_timeout = 0.01  # bounds of an adaptive timeout, in seconds
+max_timeout = 5.0
+initial_round_trip_timeout = 1.0  # timeout of a peer without round-trip samples yet, as in TCP
+round_trip_mean_gain = 1 / 8  # weights of a new sample in the smoothed round trip and its deviation
+round_trip_deviation_gain = 1 / 4
+
+payload_dataclass = overwrite_dataclass(dataclass)
+
+
+@payload_dataclass(msg_id=100)
+class NodesReady:
+    """Floods the ids of nodes that reached all their neighbours, for the start barrier."""
+
+    node_ids: bytes  # big endian uint32s
+    complete: bool  # whether these are all ready nodes the sender knows of
+
+
+@payload_dataclass(msg_id=101)
+class RoundTripProbe:
+    """Asks a neighbour to echo a timestamp, which measures the round-trip time to it."""
+
+    sent_at: int  # perf_counter_ns of the node that sent the probe
+    reply: bool
+
+
+def pack_node_ids(node_ids: Iterable[int]) -> bytes:
+    node_ids = list(node_ids)
+    return struct.pack(f">{len(node_ids)}I", *node_ids)
+
+
+def unpack_node_ids(data: bytes) -> List[int]:
+    if len(data) % 4 != 0:
+        raise ValueError(f"Invalid node ids of {len(data)} bytes")
+    return list(struct.unpack(f">{len(data) // 4}I", data))
+
 
 def message_wrapper(
     *payloads: type[AnyPayload],
 ) -> Callable[[LazyWrappedHandler], MessageHandlerFunction]:
-    return lazy_wrapper(*payloads)
+    """Unpacks the payloads like lazy_wrapper, and measures the handler if metrics are enabled."""
+    name = payloads[-1].__name__
+
+    def decorator(func: LazyWrappedHandler) -> MessageHandlerFunction:
+        plain = lazy_wrapper(*payloads)(func)
+
+        @wraps(func)
+        def measure(self, peer: Peer, *unpacked):
+            return self.metrics.handle(name, func, self, peer, *unpacked)
+
+        measured = lazy_wrapper(*payloads)(measure)
+
+        @wraps(func)
+        def wrapper(self, source_address, data: bytes):
+            if self.metrics is None:
+                return plain(self, source_address, data)
+            self.metrics.receiving(name, data)
+            return measured(self, source_address, data)
+
+        return wrapper
+
+    return decorator
+
+
+class PeerMap(MutableMapping):
+    """A dict of node id: peer, that also indexes the node ids by peer.
+
+    Peers are indexed by the mid of their public key, which is also what peer
+    equality is based on, so reverse lookups are O(1). ``version`` changes with
+    every change of the map, so caches derived from it know when to be rebuilt.
+    """
+
+    def __init__(self) -> None:
+        self._peers: Dict[int, Peer] = {}
+        self._node_ids: Dict[bytes, int] = {}  # mid: node id
+        self.version = 0
+
+    def __getitem__(self, node_id: int) -> Peer:
+        return self._peers[node_id]
+
+    def __setitem__(self, node_id: int, peer: Peer) -> None:
+        old = self._peers.get(node_id)
+        if old is not None and self._node_ids.get(old.mid) == node_id:
+            del self._node_ids[old.mid]
+        self._peers[node_id] = peer
+        self._node_ids[peer.mid] = node_id
+        self.version += 1
+
+    def __delitem__(self, node_id: int) -> None:
+        peer = self._peers.pop(node_id)
+        if self._node_ids.get(peer.mid) == node_id:
+            del self._node_ids[peer.mid]
+        self.version += 1
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._peers)
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+    def __repr__(self) -> str:
+        return repr(self._peers)
+
+    def node_id(self, peer: Peer) -> Optional[int]:
+        return self._node_ids.get(peer.mid)
+
+    def node_id_from_mid(self, mid: bytes) -> Optional[int]:
+        return self._node_ids.get(mid)
+
+
+class RoundTripEstimator:
+    """Smoothed round-trip times per peer, and the timeouts derived from them.
+
+    Like TCP (RFC 6298), every peer has an exponentially weighted mean of its
+    round-trip times and of their deviation from that mean. Its timeout is the
+    mean plus four deviations, so it stays close to the round trip on a steady
+    link and grows with jitter. Peers without samples get the initial timeout.
+    """
+
+    def __init__(self, initial_timeout: float = initial_round_trip_timeout) -> None:
+        self.initial_timeout = initial_timeout
+        self._estimates: Dict[bytes, Tuple[float, float]] = {}  # mid: mean, deviation
+
+    def __len__(self) -> int:
+        return len(self._estimates)
+
+    def add_sample(self, mid: bytes, round_trip: float) -> None:
+        estimate = self._estimates.get(mid)
+        if estimate is None:
+            self._estimates[mid] = (round_trip, round_trip / 2)
+            return
+        mean, deviation = estimate
+        deviation += round_trip_deviation_gain * (abs(mean - round_trip) - deviation)
+        mean += round_trip_mean_gain * (round_trip - mean)
+        self._estimates[mid] = (mean, deviation)
+
+    def round_trip(self, mid: bytes) -> Optional[float]:
+        """The smoothed round-trip time to a peer, None without samples."""
+        estimate = self._estimates.get(mid)
+        return None if estimate is None else estimate[0]
+
+    def timeout(self, mid: bytes) -> float:
+        estimate = self._estimates.get(mid)
+        if estimate is None:
+            return self.initial_timeout
+        mean, deviation = estimate
+        return mean + 4 * deviation
 
 
 class Blockchain(Community):
@@ -26,11 +182,53 @@ class Blockchain(Community):
         super().__init__(settings)
         self.event: Event = None  # type:ignore
         # Register the message handler for messages (with the identifier "1").
-        self.nodes: Dict[int, Peer] = {}
+        self._peer_maps: List[PeerMap] = []
+        self.nodes = self.peer_map()
         self.pending_transactions = {}
+        self.logger = NodeLogger(self)
+        # per message type traffic and timings, only collected when enabled
+        self.metrics: Optional[MessageMetrics] = (
+            MessageMetrics() if getattr(settings, "metrics", False) else None
+        )
+        self.metrics_interval: float = getattr(settings, "metrics_interval", 0)
+
+        # startup: on_start runs once all neighbours are reachable, or with the start barrier,
+        # once every node of the cluster has reported that its neighbours are reachable
+        self.start_barrier: bool = getattr(settings, "start_barrier", False)
+        self.cluster_size: Optional[int] = getattr(settings, "cluster_size", None)
+        if self.start_barrier and not self.cluster_size:
+            raise ValueError("The start barrier needs the cluster_size setting")
+        self.started_at: Optional[float] = None
+        self.time_to_ready: Optional[float] = None  # seconds from started() until all neighbours are reachable
+        self.time_to_start: Optional[float] = None  # seconds from started() until on_start
+        self.ready_nodes: Set[int] = set()
+        self._unreached: Dict[int, Tuple[int, Tuple[str, int]]] = {}  # port: node id, address
+        self.add_message_handler(NodesReady, self.on_nodes_ready)
+
+        # timeouts, see round_trip_timeout; with adaptive timeouts the neighbours are probed
+        self.timeout_mode: str = getattr(settings, "timeout_mode", "fixed")
+        assert self.timeout_mode in timeout_modes, f"{self.timeout_mode=}"
+        self.min_timeout: float = getattr(settings, "min_timeout", min_timeout)
+        self.max_timeout: float = getattr(settings, "max_timeout", max_timeout)
+        self.probe_interval: float = getattr(settings, "probe_interval", probe_interval)
+        self.round_trips = RoundTripEstimator()
+        self.add_message_handler(RoundTripProbe, self.on_round_trip_probe)
 
-    def node_id_from_peer(self, peer: Peer):
-        return next((key for key, p in self.nodes.items() if p == peer), None)
+    def peer_map(self) -> PeerMap:
+        """Creates a dict of node id: peer that is searched by node_id_from_peer."""
+        peers = PeerMap()
+        self._peer_maps.append(peers)
+        return peers
+
+    def node_id_from_peer(self, peer: Peer) -> Optional[int]:
+        return self.node_id_from_mid(peer.mid)
+
+    def node_id_from_mid(self, mid: bytes) -> Optional[int]:
+        for peers in self._peer_maps:
+            node_id = peers.node_id_from_mid(mid)
+            if node_id is not None:
+                return node_id
+        return None
 
     async def started(
         self,
@@ -42,51 +240,200 @@ class Blockchain(Community):
         self.event = event
         self.node_id = node_id
         self.connections = connections
-        self.on_start_delay = random.uniform(1.0, 2.0)  # Seconds
+        self.started_at = perf_counter()
         host_network = self._get_lan_address()[0]
-        host_network_base = ".".join(host_network.split(".")[:3])
-
-        async def _ensure_nodes_connected() -> None:
-            # Make connections to known peers
-            for node_id, conn in connections:
-                ip_address = f"{host_network_base}.{node_id + 10}"
-                if use_localhost:
-                    ip_address = host_network
-                ad = (ip_address, conn)
-                self.walk_to(ad)
-            valid = False
-            conn_nodes = []
-
-            for node_id, node_port in self.connections:
-                conn_nodes = [p for p in self.get_peers() if p.address[1] == node_port]
-                if len(conn_nodes) == 0:
-                    return
-                valid = True
-                self.nodes[node_id] = conn_nodes[0]
-            if not valid:
-                return
-            self.cancel_pending_task("ensure_nodes_connected")
-            print(f"[Node {self.node_id}] Starting")
-            self.register_anonymous_task(
-                "delayed_start", self.on_start, delay=self.on_start_delay
+        # docker addresses are consecutive by node id (see topology.node_address), so the
+        # address of a peer is ours shifted by the difference in node ids, in any subnet size
+        host_address = ipaddress.ip_address(host_network)
+        for node_id, port in connections:
+            if use_localhost:
+                ip_address = host_network
+            else:
+                ip_address = str(host_address + (node_id - self.node_id))
+            self._unreached[port] = (node_id, (ip_address, port))
+
+        if not self._check_neighbours():
+            self.register_task("walk_to_neighbours", self._walk_to_neighbours)
+        if self.metrics is not None and self.metrics_interval > 0:
+            self.register_task(
+                "dump_metrics",
+                self.dump_metrics,
+                delay=self.metrics_interval,
+                interval=self.metrics_interval,
             )
 
+    async def _walk_to_neighbours(self) -> None:
+        """Walks to the neighbours that were not reached yet, backing off exponentially."""
+        delay = first_walk_delay
+        while not self._check_neighbours():
+            for _, address in self._unreached.values():
+                self.walk_to(address)
+            await sleep(delay)
+            delay = min(2 * delay, max_walk_delay)
+
+    def _check_neighbours(self) -> bool:
+        """Registers the neighbours that became reachable, returns whether all of them are."""
+        if self.started_at is None:
+            return False  # introductions from nodes that were started before us
+        if self.time_to_ready is not None:
+            return True
+        if self._unreached:
+            for peer in self.get_peers():
+                node_id, _ = self._unreached.pop(peer.address[1], (None, None))
+                if node_id is not None:
+                    self.nodes[node_id] = peer
+            if self._unreached:
+                return False
+        self._on_ready()
+        return True
+
+    def introduction_request_callback(self, peer, dist, payload) -> None:
+        if self.time_to_ready is None and self._check_neighbours():
+            self.cancel_pending_task("walk_to_neighbours")
+
+    def introduction_response_callback(self, peer, dist, payload) -> None:
+        if self.time_to_ready is None and self._check_neighbours():
+            self.cancel_pending_task("walk_to_neighbours")
+
+    def _on_ready(self) -> None:
+        self.time_to_ready = perf_counter() - self.started_at
+        if self.timeout_mode == "adaptive":
+            # the first probes go out right away, so there are samples by the time the algorithm waits
+            self.register_task(
+                "probe_round_trips", self.probe_round_trips, interval=self.probe_interval, delay=0
+            )
+        if not self.start_barrier:
+            self._start()
+            return
+        self.logger.info("Ready", time_to_ready=round(self.time_to_ready, 3))
+        self.ready_nodes.add(self.node_id)
+        # also pass on the nodes we heard of before we knew all our neighbours
+        self._send_ready_nodes()
         self.register_task(
-            "ensure_nodes_connected", _ensure_nodes_connected, interval=0.5, delay=1
+            "resend_nodes_ready",
+            self._send_ready_nodes,
+            delay=barrier_resend_interval,
+            interval=barrier_resend_interval,
         )
+        self._check_barrier()
+
+    def _send_ready_nodes(self) -> None:
+        self.ez_send_many(
+            self.nodes.values(), NodesReady(pack_node_ids(sorted(self.ready_nodes)), True)
+        )
+
+    def _check_barrier(self) -> None:
+        if self.time_to_ready is not None and len(self.ready_nodes) >= self.cluster_size:
+            self.cancel_pending_task("resend_nodes_ready")
+            self._start()
+
+    def _start(self) -> None:
+        if self.time_to_start is not None:
+            return
+        self.time_to_start = perf_counter() - self.started_at
+        self.logger.info(
+            "Starting",
+            time_to_ready=round(self.time_to_ready, 3),
+            time_to_start=round(self.time_to_start, 3),
+        )
+        self.register_anonymous_task("start", self.on_start)
+
+    @message_wrapper(NodesReady)
+    async def on_nodes_ready(self, peer: Peer, payload: NodesReady) -> None:
+        """Floods newly ready node ids, and answers a complete set that lacks ids we know."""
+        try:
+            node_ids = unpack_node_ids(payload.node_ids)
+        except ValueError:
+            self.logger.warning("Received invalid ready node ids", size=len(payload.node_ids))
+            return
+        new = [node_id for node_id in node_ids if node_id not in self.ready_nodes]
+        if new:
+            self.ready_nodes.update(new)
+            others = [p for p in self.nodes.values() if p.mid != peer.mid]
+            self.ez_send_many(others, NodesReady(pack_node_ids(new), False))
+        if payload.complete and len(node_ids) < len(self.ready_nodes):
+            missing = self.ready_nodes.difference(node_ids)
+            self.ez_send(peer, NodesReady(pack_node_ids(sorted(missing)), False))
+        if new and self.start_barrier:
+            self._check_barrier()
+
+    def probe_targets(self) -> Iterable[Peer]:
+        """The peers whose round-trip times are measured, the neighbours by default."""
+        return self.nodes.values()
+
+    def probe_round_trips(self) -> None:
+        self.probe(self.probe_targets())
+
+    def probe(self, peers: Iterable[Peer]) -> None:
+        """Measures the round trips to peers, if timeouts are adaptive."""
+        if self.timeout_mode == "adaptive":
+            self.ez_send_many(peers, RoundTripProbe(perf_counter_ns(), False))
+
+    @message_wrapper(RoundTripProbe)
+    async def on_round_trip_probe(self, peer: Peer, payload: RoundTripProbe) -> None:
+        """Echoes a probe, or measures the round trip of an echo of our own probe."""
+        if not payload.reply:
+            self.ez_send(peer, RoundTripProbe(payload.sent_at, True))
+            return
+        round_trip = (perf_counter_ns() - payload.sent_at) / 1e9
+        if round_trip >= 0:
+            self.round_trips.add_sample(peer.mid, round_trip)
+
+    def round_trip_timeout(
+        self, peers: Iterable[Peer], fixed: float, round_trips: float = 1, retries: int = 0
+    ) -> float:
+        """Seconds to wait for an answer that depends on all of peers.
+
+        With fixed timeouts this is ``fixed``. With adaptive timeouts it is
+        ``round_trips`` times the timeout of the slowest of the peers, within
+        min_timeout and max_timeout. Both double with every retry, up to the
+        larger of the two and max_timeout.
+        """
+        if self.timeout_mode == "fixed":
+            return min(fixed * 2**retries, max(fixed, self.max_timeout))
+        slowest = max(
+            (self.round_trips.timeout(peer.mid) for peer in peers),
+            default=self.round_trips.initial_timeout,
+        )
+        return min(max(round_trips * slowest, self.min_timeout) * 2**retries, self.max_timeout)
 
     def on_start(self):
         pass
 
     def stop(self, delay: int = 0):
         async def delayed_stop():
-            print(f"[Node {self.node_id}] Stopping algorithm")
+            self.logger.info("Stopping algorithm")
             self.event.set()
 
         self.register_anonymous_task("delayed_stop", delayed_stop, delay=delay)
 
+    def message_metrics(self) -> Optional[dict]:
+        """Per message type traffic and timings so far, None if metrics are disabled."""
+        return None if self.metrics is None else self.metrics.summary()
+
+    def dump_metrics(self) -> None:
+        for message_type, stats in self.metrics.report().items():
+            self.logger.info("metrics", message_type=message_type, **stats)
+
     def ez_send(self, peer: Peer, *payloads: AnyPayload, **kwargs) -> None:
-        super().ez_send(peer, *payloads, **kwargs)
+        if self.metrics is None:
+            super().ez_send(peer, *payloads, **kwargs)
+        else:
+            self.ez_send_many((peer,), *payloads, **kwargs)
+
+    def ez_send_many(self, peers: Iterable[Peer], *payloads: AnyPayload, **kwargs) -> None:
+        """Sends the same payloads to several peers, packing and signing them only once."""
+        packet = None
+        count = 0
+        for peer in peers:
+            if packet is None:
+                start = perf_counter()
+                packet = self.ezr_pack(payloads[-1].msg_id, *payloads, **kwargs)
+                encode_time = perf_counter() - start
+            self.endpoint.send(peer.address, packet)
+            count += 1
+        if packet is not None and self.metrics is not None:
+            self.metrics.sent(type(payloads[-1]).__name__, packet, count, encode_time)
 
     def add_message_handler(
         self, msg_num: int | type[AnyPayload], callback: MessageHandlerFunction
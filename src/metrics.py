@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import inspect
+from math import frexp
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional
+
+min_exponent = -20  # the first histogram bucket holds everything below 2**-20 s, about 1 µs
+max_exponent = 6  # the last one everything from 2**5 s, 32 s
+
+
+class Histogram:
+    """A histogram of durations in seconds, with one bucket per power of two.
+
+    Recording a value is a couple of integer operations, so it can be done for
+    every message. Percentiles are estimated as the upper bound of the bucket
+    they fall in, which is at most a factor two off.
+    """
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (max_exponent - min_exponent + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        exponent = frexp(value)[1]  # value < 2**exponent
+        self.buckets[min(max(exponent, min_exponent), max_exponent) - min_exponent] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th percentile (0-100), None if empty."""
+        if self.count == 0:
+            return None
+        rank = self.count * q / 100
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(2.0 ** (i + min_exponent), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+        }
+
+
+class MessageStats:
+    """Traffic and timings of one message type."""
+
+    def __init__(self) -> None:
+        self.received = 0
+        self.bytes_in = 0
+        self.sent = 0
+        self.bytes_out = 0
+        self.decode = Histogram()  # unpacking and signature verification
+        self.handler = Histogram()  # wall time of the handler, including its awaits
+        self.encode = Histogram()  # packing and signing, once per ez_send(_many)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "bytes_in": self.bytes_in,
+            "sent": self.sent,
+            "bytes_out": self.bytes_out,
+            "decode": self.decode.summary(),
+            "handler": self.handler.summary(),
+            "encode": self.encode.summary(),
+        }
+
+
+class MessageMetrics:
+    """Per message type counts, sizes, and decode, handler and encode times of a node.
+
+    Filled in by ``message_wrapper`` and ``Blockchain.ez_send(_many)`` when a
+    node is created with the ``metrics`` setting.
+    """
+
+    def __init__(self) -> None:
+        self.messages: Dict[str, MessageStats] = {}
+        self._decode_start = 0.0
+
+    def stats(self, name: str) -> MessageStats:
+        stats = self.messages.get(name)
+        if stats is None:
+            stats = self.messages[name] = MessageStats()
+        return stats
+
+    def receiving(self, name: str, data: bytes) -> None:
+        """Called before a packet is decoded; the decoding ends when the handler is called."""
+        stats = self.stats(name)
+        stats.received += 1
+        stats.bytes_in += len(data)
+        self._decode_start = perf_counter()
+
+    def handle(self, name: str, func: Callable, *args) -> Any:
+        """Calls a decoded handler, and records its decode and wall time."""
+        start = perf_counter()
+        stats = self.stats(name)
+        stats.decode.record(start - self._decode_start)
+        result = func(*args)
+        if inspect.iscoroutine(result):
+            return self._measure(stats.handler, start, result)
+        stats.handler.record(perf_counter() - start)
+        return result
+
+    async def _measure(self, histogram: Histogram, start: float, coroutine) -> Any:
+        try:
+            return await coroutine
+        finally:
+            histogram.record(perf_counter() - start)
+
+    def sent(self, name: str, packet: bytes, peers: int, encode_time: float) -> None:
+        stats = self.stats(name)
+        stats.sent += peers
+        stats.bytes_out += peers * len(packet)
+        stats.encode.record(encode_time)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.summary() for name, stats in sorted(self.messages.items())}
+
+    def report(self) -> Dict[str, Dict[str, Any]]:
+        """The main numbers per message type, flat, for the periodic dump."""
+        report = {}
+        for name, stats in sorted(self.messages.items()):
+            p99 = stats.handler.percentile(99)
+            report[name] = {
+                "received": stats.received,
+                "bytes_in": stats.bytes_in,
+                "sent": stats.sent,
+                "bytes_out": stats.bytes_out,
+                "handler_ms": round(stats.handler.total * 1000, 2),
+                "handler_p99_ms": None if p99 is None else round(p99 * 1000, 3),
+                "decode_ms": round(stats.decode.total * 1000, 2),
+                "encode_ms": round(stats.encode.total * 1000, 2),
+            }
+        return report
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Any, Optional, TextIO
+
+logger_name = "blockchain"  # the parent of the loggers of all nodes
+log_formats = ("text", "json")
+log_levels = ("DEBUG", "INFO", "WARNING", "ERROR")
+reserved_arguments = ("exc_info", "stack_info", "stacklevel", "extra")
+
+
+class NodeLogger(logging.LoggerAdapter):
+    """The logger of one node.
+
+    Every record carries the id of the node, and the keyword arguments of the
+    logging call as structured fields:
+
+        self.logger.debug("received vote", block=payload.block_height)
+
+    The message and fields are only formatted when the level is enabled, so
+    debug calls on hot paths are cheap when they are filtered out.
+    """
+
+    def __init__(self, node: Any) -> None:
+        super().__init__(logging.getLogger(f"{logger_name}.{type(node).__name__.lower()}"), {})
+        self.node = node
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs) if key not in reserved_arguments}
+        kwargs["extra"] = {"node_id": getattr(self.node, "node_id", None), "fields": fields}
+        return msg, kwargs
+
+
+class TextFormatter(logging.Formatter):
+    """``[Node 3] message key=value``, with the level for warnings and errors."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        node_id = getattr(record, "node_id", None)
+        prefix = "" if node_id is None else f"[Node {node_id}] "
+        if record.levelno >= logging.WARNING:
+            prefix += f"{record.levelname}: "
+        fields = getattr(record, "fields", {})
+        line = prefix + record.getMessage() + "".join(f" {k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the structured fields as top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "node": getattr(record, "node_id", None),
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(
+    level: str = "INFO", log_format: str = "text", stream: Optional[TextIO] = None
+) -> QueueListener:
+    """Sends the logs of all nodes in this process through a queue to a background writer.
+
+    Logging calls on the event loop only put the record in the queue; formatting
+    and writing to the stream happens in the thread of the returned listener,
+    which is flushed and stopped at exit.
+    """
+    if log_format not in log_formats:
+        raise ValueError(f"Unknown log format {log_format}, expected one of {log_formats}")
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+    queue: SimpleQueue = SimpleQueue()
+    listener = QueueListener(queue, handler)
+
+    logger = logging.getLogger(logger_name)
+    logger.handlers = [QueueHandler(queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,11 +1,15 @@
 import argparse
-import yaml
-from asyncio import run
+import signal
+from asyncio import FIRST_COMPLETED, Event, ensure_future, gather, run, wait
+from multiprocessing import Process
+from typing import List
 from ipv8.configuration import ConfigBuilder, default_bootstrap_defs
 from ipv8.util import create_event_with_signals
 from ipv8_service import IPv8
 from algorithms import *
 from da_types import Blockchain
+from topology import count_nodes, load_connections
+from node_logging import configure_logging, log_formats, log_levels
 
 
 def get_algorithm(name: str) -> Blockchain:
@@ -20,10 +24,150 @@ def get_algorithm(name: str) -> Blockchain:
     return algorithms[name]
 
 
+def parse_node_ids(spec: str) -> List[int]:
+    """The node ids of "3", "0-63" or "0-3,8,10-11"."""
+    node_ids = []
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        node_ids.extend(range(int(first), int(last or first) + 1))
+    return node_ids
+
+
+def split_node_ids(node_ids: List[int], parts: int) -> List[List[int]]:
+    """Splits node ids into at most parts consecutive ranges of (nearly) equal size."""
+    parts = max(1, min(parts, len(node_ids)))
+    bounds = [len(node_ids) * i // parts for i in range(parts + 1)]
+    return [node_ids[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def add_node_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the options of the node settings, shared by run.py and simulate.py."""
+    parser.add_argument(
+        "--gossip",
+        choices=["flood", "inventory"],
+        default="flood",
+        help="how validators spread transactions: full bodies, or ids followed by requests",
+    )
+    parser.add_argument(
+        "--election",
+        choices=["flood", "aggregate"],
+        default="flood",
+        help="how validators spread election messages: one by one, or the whole known set at once",
+    )
+    parser.add_argument(
+        "--leaders",
+        choices=["election", "schedule"],
+        default="election",
+        help="elect the leader of every block, or derive the leaders of the next blocks from one election",
+    )
+    parser.add_argument(
+        "--votes",
+        choices=["broadcast", "certificate"],
+        default="broadcast",
+        help="send block votes to every validator, or to the proposer, which broadcasts a certificate",
+    )
+    parser.add_argument(
+        "--block-order",
+        choices=["fifo", "nonce", "amount"],
+        default="fifo",
+        help="which pending transactions a leader puts in a block first",
+    )
+    parser.add_argument(
+        "--block-bytes", type=int, default=64_000, help="byte budget of a packed block"
+    )
+    parser.add_argument(
+        "--block-width",
+        type=int,
+        default=5,
+        help="cap on the transactions per block, 0 for the builder's budget of 255",
+    )
+    parser.add_argument(
+        "--pipeline",
+        type=int,
+        default=1,
+        help="unfinalized heights a leader may propose on top of, 1 waits for every block's votes",
+    )
+    parser.add_argument(
+        "--timeouts",
+        choices=["fixed", "adaptive"],
+        default="fixed",
+        help="wait fixed times in elections and for votes, or derive the waits from probed round-trip times",
+    )
+    parser.add_argument(
+        "--min-timeout", type=float, default=0.01, help="lower bound of an adaptive timeout in seconds"
+    )
+    parser.add_argument(
+        "--max-timeout", type=float, default=5.0, help="upper bound of an adaptive timeout in seconds"
+    )
+    parser.add_argument(
+        "--history-retention",
+        type=int,
+        default=1000,
+        help="number of recent transactions a client keeps before compacting them",
+    )
+    parser.add_argument(
+        "--log-level", choices=log_levels, default="INFO", help="debug also logs every message"
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=log_formats,
+        default="text",
+        help="json writes one JSON object per line, for the benchmark tooling",
+    )
+    parser.add_argument(
+        "--barrier",
+        action="store_true",
+        help="start the algorithm only when every node of the topology can reach its neighbours",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=float,
+        default=None,
+        metavar="INTERVAL",
+        help="collect per message type traffic and timings, and print them every INTERVAL seconds",
+    )
+    parser.add_argument(
+        "--data-dir",
+        type=str,
+        default=None,
+        help="keep the chain of every validator on disk in this directory, and recover it on restart",
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=int,
+        default=100,
+        help="with --data-dir, snapshot the account state every this many finalized blocks",
+    )
+
+
+def settings_from_args(args: argparse.Namespace) -> dict:
+    """The community settings of the options added by add_node_arguments."""
+    return {
+        "gossip_mode": args.gossip,
+        "election_mode": args.election,
+        "leader_mode": args.leaders,
+        "vote_mode": args.votes,
+        "block_ordering": args.block_order,
+        "max_block_bytes": args.block_bytes,
+        "block_width": args.block_width,
+        "pipeline_depth": args.pipeline,
+        "timeout_mode": args.timeouts,
+        "min_timeout": args.min_timeout,
+        "max_timeout": args.max_timeout,
+        "history_retention": args.history_retention,
+        "metrics": args.metrics is not None,
+        "metrics_interval": args.metrics or 0,
+        "start_barrier": args.barrier,
+        "data_dir": args.data_dir,
+        "snapshot_interval": args.snapshot_interval,
+    }
+
+
 async def start_communities(
-    node_id, connections, algorithm, use_localhost=True
+    node_id, connections, algorithm, use_localhost=True, settings=None, stop_event=None
 ) -> None:
-    event = create_event_with_signals()
+    # a node stops when its algorithm does, or when the whole process is stopped
+    event = Event() if stop_event is not None else create_event_with_signals()
     base_port = 9090
     connections_updated = [(x, base_port + x) for x in connections]
     node_port = base_port + node_id
@@ -35,35 +179,104 @@ async def start_communities(
         "my peer",
         [],
         default_bootstrap_defs,
-        {},
+        settings or {},  # extra attributes for the community settings
         [("started", node_id, connections_updated, event, use_localhost)],
     )
     ipv8_instance = IPv8(
         builder.finalize(), extra_communities={"blockchain_community": algorithm}
     )
     await ipv8_instance.start()
-    await event.wait()
+    if stop_event is None:
+        await event.wait()
+    else:
+        waiters = [ensure_future(event.wait()), ensure_future(stop_event.wait())]
+        _, pending = await wait(waiters, return_when=FIRST_COMPLETED)
+        for waiter in pending:
+            waiter.cancel()
     await ipv8_instance.stop()
 
 
+async def start_node_range(
+    node_ids, topology, algorithm, use_localhost=True, settings=None
+) -> None:
+    """Hosts several nodes in this process, each with its own IPv8 instance, on one event loop."""
+    stop_event = create_event_with_signals()
+    await gather(
+        *(
+            start_communities(
+                node_id,
+                # only this node's row is read from a binary .topo topology
+                load_connections(topology, node_id),
+                algorithm,
+                use_localhost,
+                settings,
+                stop_event,
+            )
+            for node_id in node_ids
+        )
+    )
+
+
+def run_node_range(
+    node_ids, topology, algorithm_name, use_localhost, settings, log_level, log_format
+) -> None:
+    """Entry point of a worker process: runs a range of nodes until they all stopped."""
+    configure_logging(log_level, log_format)
+    algorithm = get_algorithm(algorithm_name)
+    run(start_node_range(node_ids, topology, algorithm, use_localhost, settings))
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog="Blockchain",
         description="Code to execute blockchain.",
         epilog="Designed for A27 Fundamentals and Design of Blockchain-based Systems",
     )
-    parser.add_argument("node_id", type=int)
+    parser.add_argument(
+        "node_id",
+        type=str,
+        help='the node to run, or several nodes to host in this process: "0-63" or "0-3,8"',
+    )
     parser.add_argument(
         "topology", type=str, nargs="?", default="topologies/default.yaml"
     )
     parser.add_argument("algorithm", type=str, nargs="?", default="echo")
     parser.add_argument("-docker", action="store_true")
+    add_node_arguments(parser)
+    parser.add_argument(
+        "--clients",
+        type=str,
+        default=None,
+        help='the client node ids, like "3-4", for the address book of every client; util.py passes them',
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="spread the nodes over this many processes, each with its own event loop",
+    )
     args = parser.parse_args()
-    node_id = args.node_id
+    node_ids = parse_node_ids(args.node_id)
 
-    alg = get_algorithm(args.algorithm)
-    with open(args.topology, "r") as f:
-        topology = yaml.safe_load(f)
-        connections = topology[node_id]
+    settings = settings_from_args(args)
+    if args.clients is not None:
+        settings["client_ids"] = parse_node_ids(args.clients)
+    if args.barrier:
+        settings["cluster_size"] = count_nodes(args.topology)
 
-        run(start_communities(node_id, connections, alg, not args.docker))
+    ranges = split_node_ids(node_ids, args.workers)
+    worker_args = [
+        (node_range, args.topology, args.algorithm, not args.docker, settings, args.log_level, args.log_format)
+        for node_range in ranges
+    ]
+    if len(ranges) == 1:
+        run_node_range(*worker_args[0])
+    else:
+        workers = [Process(target=run_node_range, args=a) for a in worker_args]
+        for worker in workers:
+            worker.start()
+        # the workers stop on the signals themselves
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import argparse
+import random
+from asyncio import Event, get_running_loop, run, wait_for
+from typing import Dict, List, Optional, Type
+
+from ipv8.keyvault.crypto import default_eccrypto
+from ipv8.messaging.interfaces.endpoint import Endpoint
+from ipv8.peer import Peer
+from ipv8.peerdiscovery.network import Network
+from ipv8.types import Address
+
+from algorithms import Client, Validator
+from da_types import Blockchain
+from node_logging import configure_logging
+from run import add_node_arguments, get_algorithm, settings_from_args
+from topology import blockchain_topology, load_topology, ring_topology
+
+base_port = 9090  # the same port numbering as run.py
+
+
+class SimulatedNetwork:
+    """An in-memory network that delivers packets between endpoints on the event loop.
+
+    Endpoints are addressed by port only, like every node of run.py has its own
+    port. Every packet is delayed by latency plus a uniform random jitter, and is
+    dropped with probability loss.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.endpoints: Dict[int, SimulatedEndpoint] = {}  # port: endpoint
+        self.packets = 0
+        self.bytes = 0
+        self.dropped = 0
+
+    def deliver(self, source: Address, destination: Address, packet: bytes) -> None:
+        self.packets += 1
+        self.bytes += len(packet)
+        endpoint = self.endpoints.get(destination[1])
+        if endpoint is None or (self.loss > 0 and self.random.random() < self.loss):
+            self.dropped += 1
+            return
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter > 0 else 0)
+        if delay > 0:
+            get_running_loop().call_later(delay, endpoint.receive, source, packet)
+        else:
+            get_running_loop().call_soon(endpoint.receive, source, packet)
+
+
+class SimulatedEndpoint(Endpoint):
+    """Endpoint that sends its packets through a SimulatedNetwork instead of a socket."""
+
+    def __init__(self, network: SimulatedNetwork, address: Address) -> None:
+        super().__init__()
+        self.network = network
+        self.address = address
+        self.bytes_up = 0
+        self.bytes_down = 0
+        self._open = False
+        network.endpoints[address[1]] = self
+
+    def assert_open(self) -> None:
+        assert self._open
+
+    def is_open(self) -> bool:
+        return self._open
+
+    def get_address(self) -> Address:
+        return self.address
+
+    def send(self, socket_address: Address, packet: bytes) -> None:
+        if not self._open:
+            return
+        self.bytes_up += len(packet)
+        self.network.deliver(self.address, socket_address, packet)
+
+    def receive(self, source: Address, packet: bytes) -> None:
+        if not self._open:
+            return
+        self.bytes_down += len(packet)
+        self.notify_listeners((source, packet))
+
+    async def open(self) -> bool:  # noqa: A003
+        self._open = True
+        return True
+
+    def close(self) -> None:
+        self._open = False
+
+    def reset_byte_counters(self) -> None:
+        self.bytes_up = 0
+        self.bytes_down = 0
+
+
+class Simulation:
+    """Runs many Blockchain communities in one process, on one SimulatedNetwork."""
+
+    def __init__(self, network: SimulatedNetwork, curve: str = "curve25519") -> None:
+        self.network = network
+        self.curve = curve
+        self.communities: Dict[int, Blockchain] = {}
+        self.connections: Dict[int, List[int]] = {}
+        self.events: Dict[int, Event] = {}
+
+    async def add_node(
+        self,
+        node_id: int,
+        algorithm: Type[Blockchain],
+        connections: List[int],
+        settings: Optional[dict] = None,
+    ) -> Blockchain:
+        endpoint = SimulatedEndpoint(self.network, ("127.0.0.1", base_port + node_id))
+        await endpoint.open()
+        my_peer = Peer(default_eccrypto.generate_key(self.curve), endpoint.get_address())
+        community = algorithm(
+            algorithm.settings_class(
+                my_peer=my_peer, endpoint=endpoint, network=Network(), **(settings or {})
+            )
+        )
+        community.my_estimated_lan = endpoint.get_address()
+        community.my_estimated_wan = endpoint.get_address()
+        self.communities[node_id] = community
+        self.connections[node_id] = connections
+        self.events[node_id] = Event()
+        return community
+
+    async def add_topology(
+        self,
+        topology: Dict[int, List[int]],
+        algorithms: Dict[int, Type[Blockchain]],
+        settings: Optional[dict] = None,
+    ) -> None:
+        """Adds a node for every entry of topology, running the algorithm of its node id."""
+        settings = dict(settings or {})
+        # every node must be able to keep all of its neighbours as peers
+        settings.setdefault("max_peers", max(30, 2 * max(len(c) for c in topology.values())))
+        for node_id, connections in topology.items():
+            await self.add_node(node_id, algorithms[node_id], connections, settings)
+
+    async def start(self) -> None:
+        for node_id, community in self.communities.items():
+            connections = [(x, base_port + x) for x in self.connections[node_id]]
+            await community.started(node_id, connections, self.events[node_id])
+
+    async def wait(self, duration: Optional[float] = None) -> bool:
+        """Waits until every node stopped, or duration seconds passed. Returns whether all stopped."""
+
+        async def all_stopped() -> None:
+            for event in self.events.values():
+                await event.wait()
+
+        try:
+            await wait_for(all_stopped(), duration)
+            return True
+        except TimeoutError:
+            return False
+        except Exception as e:  # asyncio.TimeoutError on Python < 3.11
+            if type(e).__name__ != "TimeoutError":
+                raise
+            return False
+
+    async def stop(self) -> None:
+        for community in self.communities.values():
+            await community.unload()
+            community.endpoint.close()
+
+
+async def simulate(args) -> None:
+    network = SimulatedNetwork(args.latency, args.jitter, args.loss, args.seed)
+    simulation = Simulation(network)
+    settings = settings_from_args(args)
+
+    if args.topology is not None:
+        topology = load_topology(args.topology)
+    elif args.algorithm == "blockchain":
+        topology = blockchain_topology(args.validators, args.clients)
+    else:
+        topology = ring_topology(args.nodes)
+    # the algorithms follow the node ids of the topology, which need not match --nodes
+    if args.algorithm == "blockchain":
+        # like util.py, the first --validators nodes are validators and the others clients
+        client_ids = [node_id for node_id in topology if node_id >= args.validators]
+        settings["client_ids"] = client_ids
+        algorithms = {
+            node_id: Client if node_id in client_ids else Validator for node_id in topology
+        }
+    else:
+        algorithms = {node_id: get_algorithm(args.algorithm) for node_id in topology}
+
+    if args.barrier:
+        settings["cluster_size"] = len(topology)
+    await simulation.add_topology(topology, algorithms, settings)
+
+    await simulation.start()
+    finished = await simulation.wait(args.duration)
+    await simulation.stop()
+    print(
+        f"[Simulation] {len(topology)} nodes {'finished' if finished else 'stopped'}:"
+        f" {network.packets} packets, {network.bytes} bytes, {network.dropped} dropped"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="Simulation",
+        description="Run many nodes in one process, on an in-memory network.",
+        epilog="Designed for A27 Fundamentals and Design of Blockchain-based Systems",
+    )
+    parser.add_argument("algorithm", choices=["echo", "election", "blockchain"])
+    parser.add_argument("--nodes", type=int, default=4, help="ring size for echo and election")
+    parser.add_argument(
+        "--validators",
+        type=int,
+        default=3,
+        help="validators for blockchain; with --topology, the nodes below this id, the others are clients",
+    )
+    parser.add_argument("--clients", type=int, default=3)
+    parser.add_argument(
+        "--topology",
+        type=str,
+        default=None,
+        help="use this topology file instead of a generated one, its node ids replace --nodes and --clients",
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="one-way delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random delay in seconds")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability a packet is dropped")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--duration", type=float, default=None, help="stop after this many seconds"
+    )
+    add_node_arguments(parser)
+    args = parser.parse_args()
+    configure_logging(args.log_level, args.log_format)
+    run(simulate(args))
@@ -0,0 +1,135 @@
+import os
+
+from algorithms.block_store import (
+    BlockStore,
+    genesis_hash,
+    hash_block,
+    index_entry,
+    index_extension,
+    index_header,
+    log_extension,
+    record_header,
+)
+from algorithms.messages import Block, TransactionBody
+
+
+def make_chain(length: int) -> list[Block]:
+    blocks = []
+    prev_hash = genesis_hash
+    for height in range(1, length + 1):
+        block = Block(height, prev_hash, 1000 + height, [TransactionBody(-1, height, 10, height)])
+        prev_hash = hash_block(block)
+        blocks.append(block)
+    return blocks
+
+
+def write_chain(path: str, blocks: list[Block], finalized_height: int = 0) -> None:
+    store = BlockStore(path, sync_every=2)
+    for block in blocks:
+        assert store.add(block)
+    store.mark_finalized(finalized_height)
+    store.close()
+
+
+def assert_chain(store: BlockStore, blocks: list[Block]) -> None:
+    assert len(store) == len(blocks)
+    assert list(store) == blocks
+    for block in blocks:
+        assert store.at_height(block.block_height) == block
+        assert store.with_hash(store.digest(block)) == block
+    assert store.tip_hash == (store.digest(blocks[-1]) if blocks else genesis_hash)
+
+
+def test_reopen(tmp_path):
+    path = str(tmp_path / "chain")
+    blocks = make_chain(5)
+    write_chain(path, blocks, finalized_height=3)
+    store = BlockStore(path)
+    assert_chain(store, blocks)
+    assert store.finalized_height == 3
+    assert not store.add(blocks[0])
+    store.close()
+
+
+def test_blocks_beyond_resident_are_read_from_the_log(tmp_path):
+    blocks = make_chain(6)
+    store = BlockStore(str(tmp_path / "chain"), resident=2)
+    for block in blocks:
+        store.add(block)
+    assert_chain(store, blocks)
+    store.close()
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    path = str(tmp_path / "chain")
+    blocks = make_chain(4)
+    write_chain(path, blocks)
+    size = os.path.getsize(path + log_extension)
+    with open(path + log_extension, "ab") as log:
+        # the header and half the body of a fifth block
+        log.write(record_header.pack(100, 0) + b"x" * 50)
+
+    store = BlockStore(path)
+    assert_chain(store, blocks)
+    assert os.path.getsize(path + log_extension) == size
+    # new blocks go where the torn record was
+    extra = make_chain(5)[-1]
+    store.add(extra)
+    store.close()
+    assert_chain(BlockStore(path), blocks + [extra])
+
+
+def test_corrupt_length_is_a_torn_write(tmp_path):
+    path = str(tmp_path / "chain")
+    blocks = make_chain(3)
+    write_chain(path, blocks)
+    with open(path + log_extension, "ab") as log:
+        log.write(record_header.pack(0xFFFFFFFF, 0))
+    assert_chain(BlockStore(path), blocks)
+
+
+def test_corrupt_last_record_is_dropped_from_the_index(tmp_path):
+    path = str(tmp_path / "chain")
+    blocks = make_chain(4)
+    write_chain(path, blocks)
+    with open(path + log_extension, "r+b") as log:
+        log.seek(-1, os.SEEK_END)
+        last = log.read(1)
+        log.seek(-1, os.SEEK_END)
+        log.write(bytes([last[0] ^ 0xFF]))
+
+    store = BlockStore(path)
+    assert_chain(store, blocks[:-1])
+    store.close()
+    assert os.path.getsize(path + index_extension) == index_header.size + 3 * index_entry.size
+
+
+def test_missing_index_entries_are_recovered_from_the_log(tmp_path):
+    path = str(tmp_path / "chain")
+    blocks = make_chain(5)
+    write_chain(path, blocks, finalized_height=5)
+    # a crash after the log was written, but before the index was
+    with open(path + index_extension, "r+b") as index:
+        index.truncate(index_header.size + 2 * index_entry.size + 7)
+
+    store = BlockStore(path)
+    assert_chain(store, blocks)
+    assert store.finalized_height == 5
+    store.close()
+    assert os.path.getsize(path + index_extension) == index_header.size + 5 * index_entry.size
+
+
+def test_index_pointing_past_the_log(tmp_path):
+    path = str(tmp_path / "chain")
+    blocks = make_chain(5)
+    write_chain(path, blocks, finalized_height=5)
+    # the file system kept the index but lost the end of the log
+    first_two = index_header.size + 2 * index_entry.size
+    with open(path + index_extension, "rb") as index:
+        offset = index_entry.unpack_from(index.read(), first_two)[0]
+    with open(path + log_extension, "r+b") as log:
+        log.truncate(offset + 3)
+
+    store = BlockStore(path)
+    assert_chain(store, blocks[:2])
+    assert store.finalized_height == 2
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from algorithms import execution
+from algorithms.execution import AccountBalances, max_account, max_vectorized_retries
+
+
+@pytest.fixture(params=["numpy", "sequential"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(execution, "np", None)
+    return request.param
+
+
+def execute_one_by_one(balances: dict, default_balance: int, senders, targets, amounts):
+    """The reference semantics: every transfer on its own, skipped if its sender cannot afford it.
+
+    Every account in the batch becomes known, also when its transfers are skipped.
+    """
+    accepted = []
+    for sender, target, amount in zip(senders, targets, amounts):
+        balances.setdefault(target, default_balance)
+        if sender != -1:
+            balances.setdefault(sender, default_balance)
+            if balances[sender] < amount:
+                accepted.append(False)
+                continue
+            balances[sender] -= amount
+        balances[target] += amount
+        accepted.append(True)
+    return accepted
+
+
+def random_batch(rng: random.Random, size: int, accounts: int, max_amount: int):
+    senders = [rng.choice([-1] + list(range(accounts))) for _ in range(size)]
+    targets = [rng.randrange(accounts) for _ in range(size)]
+    amounts = [rng.randint(1, max_amount) for _ in range(size)]
+    return senders, targets, amounts
+
+
+@pytest.mark.parametrize("max_amount", [10, 200, 5000])
+def test_batches_match_sequential_execution(backend, max_amount):
+    rng = random.Random(max_amount)
+    balances = AccountBalances(default_balance=100)
+    expected: dict = {}
+    for _ in range(20):
+        batch = random_batch(rng, rng.randint(1, 300), 40, max_amount)
+        assert balances.execute(*batch) == execute_one_by_one(expected, 100, *batch)
+        assert dict(balances.items()) == expected
+
+
+def test_many_overdrafts_fall_back_to_the_sequential_loop(backend):
+    # every other transfer overdraws, more often than the vectorized passes allow
+    count = 4 * max_vectorized_retries
+    senders = [0] * count
+    targets = [1] * count
+    amounts = [60, 50] * (count // 2)
+    balances = AccountBalances(default_balance=100)
+    expected: dict = {}
+    accepted = balances.execute(senders, targets, amounts)
+    assert accepted == execute_one_by_one(expected, 100, senders, targets, amounts)
+    assert accepted.count(False) > max_vectorized_retries
+    assert dict(balances.items()) == expected
+
+
+def test_empty_batch(backend):
+    assert AccountBalances().execute([], [], []) == []
+
+
+def test_dump_and_load(backend):
+    balances = AccountBalances(default_balance=5)
+    balances.execute([-1, 3, 7], [3, 7, 1000], [10, 4, 2])
+    loaded = AccountBalances.load(balances.dump(), default_balance=5)
+    assert dict(loaded.items()) == dict(balances.items()) == {3: 11, 7: 7, 1000: 7}
+    assert loaded[42] == 5
+
+
+def test_accounts_beyond_the_cap_are_rejected(backend):
+    balances = AccountBalances()
+    balances[max_account] = 1
+    with pytest.raises(KeyError):
+        balances[max_account + 1] = 1
+    with pytest.raises(KeyError):
+        balances.execute([-1], [max_account + 1], [1])
+    assert len(balances._balances) == max_account + 1
@@ -0,0 +1,57 @@
+import pytest
+
+from algorithms.reconciliation import InvertibleBloomLookupTable, cell_format, hash_count
+
+
+def test_decode_lists_the_keys_on_either_side():
+    common = [(sender, message) for sender in range(10) for message in range(20)]
+    ours = {(3, 100), (4, 101), (-1, 7)}
+    theirs = {(5, 102), (6, 103)}
+    mine = InvertibleBloomLookupTable.from_keys(common + sorted(ours), 8)
+    other = InvertibleBloomLookupTable.from_keys(common + sorted(theirs), 8)
+    assert mine.subtract(other).decode() == (ours, theirs, True)
+
+
+def test_identical_sets_decode_to_nothing():
+    keys = [(1, i) for i in range(50)]
+    table = InvertibleBloomLookupTable.from_keys(keys, 4)
+    assert table.subtract(InvertibleBloomLookupTable.from_keys(keys, 4)).decode() == (
+        set(),
+        set(),
+        True,
+    )
+
+
+def test_too_many_differences_do_not_decode():
+    mine = InvertibleBloomLookupTable.from_keys([(1, i) for i in range(100)], 2)
+    other = InvertibleBloomLookupTable(2)
+    positive, negative, complete = mine.subtract(other).decode()
+    assert not complete
+    assert positive <= {(1, i) for i in range(100)}
+    assert not negative
+
+
+def test_bytes_round_trip():
+    table = InvertibleBloomLookupTable.from_keys([(1, 2), (3, 4), (-1, 5)], 5)
+    data = table.to_bytes()
+    assert len(data) == hash_count * 5 * cell_format.size
+    decoded = InvertibleBloomLookupTable.from_bytes(data)
+    assert decoded.cells_per_hash == 5
+    assert decoded.subtract(InvertibleBloomLookupTable(5)).decode() == (
+        {(1, 2), (3, 4), (-1, 5)},
+        set(),
+        True,
+    )
+
+
+@pytest.mark.parametrize(
+    "size", [0, cell_format.size, hash_count * cell_format.size + 1, (hash_count + 1) * cell_format.size]
+)
+def test_invalid_sketch_sizes(size):
+    with pytest.raises(ValueError):
+        InvertibleBloomLookupTable.from_bytes(bytes(size))
+
+
+def test_subtracting_different_sizes():
+    with pytest.raises(ValueError):
+        InvertibleBloomLookupTable(4).subtract(InvertibleBloomLookupTable(5))
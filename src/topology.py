@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+import ipaddress
+import random
+import struct
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+Topology = Dict[int, List[int]]  # node id: the node ids it connects to
+
+binary_extension = ".topo"
+binary_header = struct.Struct(">4sI")  # magic, number of nodes
+binary_magic = b"TOPO"
+binary_offset = struct.Struct(">Q")  # index of the first neighbour of a node
+first_host = 10  # node i gets host address first_host + i in the docker subnet, like run.py
+
+
+def node_address(subnet: str, node_id: int) -> str:
+    """The docker address of a node: host first_host + node_id of the subnet."""
+    network = ipaddress.ip_network(subnet)
+    host = first_host + node_id
+    if host >= network.num_addresses - 1:  # the last address is the broadcast address
+        raise ValueError(
+            f"Subnet {subnet} has room for {network.num_addresses - first_host - 1} nodes, use a larger one"
+        )
+    return str(network[host])
+
+
+def ring_topology(num_nodes: int) -> Topology:
+    """Every node connects to its predecessor and successor, the original util.py topology."""
+    return {i: [(i + 1) % num_nodes, (i - 1) % num_nodes] for i in range(num_nodes)}
+
+
+def blockchain_topology(num_validators: int, num_clients: int) -> Topology:
+    """A validator clique with every client connected to one validator, like topologies/gossip.yaml."""
+    topology = {
+        v: [w for w in range(num_validators) if w != v] for v in range(num_validators)
+    }
+    for i in range(num_clients):
+        client_id = num_validators + i
+        validator_id = i % num_validators
+        topology[client_id] = [validator_id]
+        topology[validator_id].append(client_id)
+    return topology
+
+
+def _from_edges(num_nodes: int, edges: Iterable[Tuple[int, int]]) -> Topology:
+    topology: Topology = {i: [] for i in range(num_nodes)}
+    for u, v in edges:
+        topology[u].append(v)
+        topology[v].append(u)
+    for neighbours in topology.values():
+        neighbours.sort()
+    return topology
+
+
+def _edge(u: int, v: int) -> Tuple[int, int]:
+    return (u, v) if u < v else (v, u)
+
+
+def k_regular_topology(num_nodes: int, degree: int, seed: Optional[int] = None) -> Topology:
+    """A uniformly random graph in which every node has exactly ``degree`` neighbours.
+
+    Stubs are paired at random, after which self-loops and parallel edges are
+    removed by swapping endpoints with random other edges, which keeps every
+    degree intact. For a degree of at least 3 the result is connected with high
+    probability.
+    """
+    if not 0 < degree < num_nodes or num_nodes * degree % 2:
+        raise ValueError(f"No {degree}-regular graph on {num_nodes} nodes")
+    rng = random.Random(seed)
+    stubs = [node for node in range(num_nodes) for _ in range(degree)]
+    rng.shuffle(stubs)
+    edges = [(stubs[i], stubs[i + 1]) for i in range(0, len(stubs), 2)]
+    counts = Counter(_edge(u, v) for u, v in edges)
+
+    def is_invalid(i: int) -> bool:
+        u, v = edges[i]
+        return u == v or counts[_edge(u, v)] > 1
+
+    invalid = [i for i in range(len(edges)) if is_invalid(i)]
+    attempts = 0
+    while invalid:
+        i = invalid.pop()
+        if not is_invalid(i):
+            continue
+        attempts += 1
+        if attempts > 100 * len(edges):
+            raise ValueError(f"Could not generate a {degree}-regular graph on {num_nodes} nodes")
+        j = rng.randrange(len(edges))
+        (u, v), (x, y) = edges[i], edges[j]
+        if rng.random() < 0.5:
+            x, y = y, x
+        first, second = _edge(u, x), _edge(v, y)
+        if u == x or v == y or first == second or counts[first] or counts[second]:
+            invalid.append(i)
+            continue
+        counts[_edge(*edges[i])] -= 1
+        counts[_edge(*edges[j])] -= 1
+        edges[i], edges[j] = first, second
+        counts[first] += 1
+        counts[second] += 1
+    return _from_edges(num_nodes, edges)
+
+
+def small_world_topology(
+    num_nodes: int, degree: int, rewire: float, seed: Optional[int] = None
+) -> Topology:
+    """A Watts-Strogatz graph: a ring lattice of ``degree`` neighbours, rewired with probability ``rewire``.
+
+    Every node starts connected to the degree / 2 nearest nodes on either side;
+    each of these edges is then replaced by an edge to a random node with the
+    given probability, giving short paths while keeping most of the clustering.
+    """
+    if degree % 2 or not 0 < degree < num_nodes:
+        raise ValueError(f"The degree must be even and below {num_nodes}, not {degree}")
+    rng = random.Random(seed)
+    edges = {_edge(i, (i + j) % num_nodes) for j in range(1, degree // 2 + 1) for i in range(num_nodes)}
+    for j in range(1, degree // 2 + 1):
+        for i in range(num_nodes):
+            if rng.random() >= rewire:
+                continue
+            target = rng.randrange(num_nodes)
+            if target == i or _edge(i, target) in edges:
+                continue  # keep the lattice edge rather than creating a duplicate
+            edges.discard(_edge(i, (i + j) % num_nodes))
+            edges.add(_edge(i, target))
+    return _from_edges(num_nodes, sorted(edges))
+
+
+def scale_free_topology(num_nodes: int, links: int, seed: Optional[int] = None) -> Topology:
+    """A Barabási-Albert graph: every new node links to ``links`` nodes, preferring well connected ones.
+
+    The degrees follow a power law, so a few hubs carry a large share of the traffic.
+    """
+    if not 0 < links < num_nodes:
+        raise ValueError(f"The number of links must be between 0 and {num_nodes}, not {links}")
+    rng = random.Random(seed)
+    edges = []
+    targets = list(range(links))
+    endpoints: List[int] = []  # every node once per edge it has, for sampling by degree
+    for node in range(links, num_nodes):
+        edges.extend((node, target) for target in targets)
+        endpoints.extend(targets)
+        endpoints.extend([node] * links)
+        chosen = set()
+        while len(chosen) < links:
+            chosen.add(rng.choice(endpoints))
+        targets = list(chosen)
+    return _from_edges(num_nodes, edges)
+
+
+def sharded_topology(num_nodes: int, num_shards: int) -> Topology:
+    """Shards of consecutive node ids that are cliques, joined by a clique of their first nodes.
+
+    The first node of every shard acts as its gateway, so traffic between shards
+    goes through at most two extra hops.
+    """
+    if not 0 < num_shards <= num_nodes:
+        raise ValueError(f"Cannot split {num_nodes} nodes into {num_shards} shards")
+    bounds = [num_nodes * s // num_shards for s in range(num_shards + 1)]
+    edges = []
+    for start, end in zip(bounds, bounds[1:]):
+        edges.extend((u, v) for u in range(start, end) for v in range(u + 1, end))
+    gateways = bounds[:-1]
+    edges.extend((u, v) for i, u in enumerate(gateways) for v in gateways[i + 1 :])
+    return _from_edges(num_nodes, edges)
+
+
+def write_topology(topology: Topology, path: str) -> None:
+    """Writes a topology row by row, in the binary format if the path ends in .topo, else as YAML."""
+    if path.endswith(binary_extension):
+        _write_binary(topology, path)
+        return
+    with open(path, "w") as f:
+        for node_id, neighbours in topology.items():
+            # the same layout as yaml.safe_dump, without building the whole document
+            f.write(f"{node_id}:\n" if neighbours else f"{node_id}: []\n")
+            f.writelines(f"- {neighbour}\n" for neighbour in neighbours)
+
+
+def _write_binary(topology: Topology, path: str) -> None:
+    """Header, then one offset per node and one at the end, then all neighbour ids as uint32.
+
+    The offsets let a node read its own row with two seeks, without reading the rest.
+    """
+    num_nodes = len(topology)
+    if set(topology) != set(range(num_nodes)):
+        raise ValueError("The binary format needs node ids 0 to n - 1")
+    with open(path, "wb") as f:
+        f.write(binary_header.pack(binary_magic, num_nodes))
+        offset = 0
+        for node_id in range(num_nodes):
+            f.write(binary_offset.pack(offset))
+            offset += len(topology[node_id])
+        f.write(binary_offset.pack(offset))
+        for node_id in range(num_nodes):
+            row = array("I", topology[node_id])
+            if sys.byteorder == "little":
+                row.byteswap()  # big endian on disk, like the header
+            f.write(row.tobytes())
+
+
+def _read_binary_row(f, num_nodes: int, node_id: int) -> List[int]:
+    if not 0 <= node_id < num_nodes:
+        raise KeyError(node_id)
+    f.seek(binary_header.size + node_id * binary_offset.size)
+    start, end = struct.unpack(">QQ", f.read(2 * binary_offset.size))
+    f.seek(binary_header.size + (num_nodes + 1) * binary_offset.size + 4 * start)
+    return list(struct.unpack(f">{end - start}I", f.read(4 * (end - start))))
+
+
+def _open_binary(path: str):
+    f = open(path, "rb")
+    magic, num_nodes = binary_header.unpack(f.read(binary_header.size))
+    if magic != binary_magic:
+        f.close()
+        raise ValueError(f"{path} is not a binary topology")
+    return f, num_nodes
+
+
+def load_connections(path: str, node_id: int) -> List[int]:
+    """The connections of one node; from a binary topology only that node's row is read."""
+    if path.endswith(binary_extension):
+        f, num_nodes = _open_binary(path)
+        with f:
+            return _read_binary_row(f, num_nodes, node_id)
+    with open(path, "r") as f:
+        return yaml.safe_load(f)[node_id]
+
+
+def count_nodes(path: str) -> int:
+    """The number of nodes in a topology file, reading only the header of a binary one."""
+    if path.endswith(binary_extension):
+        f, num_nodes = _open_binary(path)
+        f.close()
+        return num_nodes
+    return len(load_topology(path))
+
+
+def load_topology(path: str) -> Topology:
+    """All connections of a topology file, YAML or binary."""
+    if path.endswith(binary_extension):
+        f, num_nodes = _open_binary(path)
+        with f:
+            offsets = struct.unpack(f">{num_nodes + 1}Q", f.read((num_nodes + 1) * binary_offset.size))
+            neighbours = struct.unpack(f">{offsets[-1]}I", f.read(4 * offsets[-1]))
+        return {
+            node_id: list(neighbours[offsets[node_id] : offsets[node_id + 1]])
+            for node_id in range(num_nodes)
+        }
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
@@ -1,6 +1,65 @@
 import yaml
-import copy
 import argparse
+import ipaddress
+
+from topology import (
+    blockchain_topology,
+    k_regular_topology,
+    node_address,
+    ring_topology,
+    scale_free_topology,
+    sharded_topology,
+    small_world_topology,
+    write_topology,
+)
+
+families = ('ring', 'k-regular', 'small-world', 'scale-free', 'blockchain', 'sharded')
+
+
+def generate_topology(args):
+    if args.family == 'ring':
+        return ring_topology(args.num_nodes)
+    if args.family == 'k-regular':
+        return k_regular_topology(args.num_nodes, args.degree, args.seed)
+    if args.family == 'small-world':
+        return small_world_topology(args.num_nodes, args.degree, args.rewire, args.seed)
+    if args.family == 'scale-free':
+        return scale_free_topology(args.num_nodes, args.degree, args.seed)
+    if args.family == 'blockchain':
+        return blockchain_topology(args.validators, args.num_nodes - args.validators)
+    return sharded_topology(args.num_nodes, args.shards)
+
+
+def write_compose(content, args, path='docker-compose.yml'):
+    """Writes the compose file one service at a time, so thousands of nodes fit in memory."""
+    template = content['services']['node0']
+    network = content['networks']['vpcbr']
+    network['ipam']['config'][0]['subnet'] = args.subnet
+    network['ipam']['config'][0]['gateway'] = str(ipaddress.ip_network(args.subnet)[1])
+    content['x-common-variables']['TOPOLOGY'] = args.topology_file
+    run_args = {}
+    if args.family == 'blockchain' and args.num_nodes > args.validators:
+        # clients send to each other, so they must know which nodes exist
+        run_args['ARGS'] = f'--clients {args.validators}-{args.num_nodes - 1}'
+    del content['services']
+    baseport = 9090
+
+    with open(path, 'w') as f:
+        yaml.safe_dump(content, f)
+        f.write('services:\n')
+        for i in range(args.num_nodes):
+            algorithm = args.algorithm
+            if args.family == 'blockchain':
+                algorithm = 'validator' if i < args.validators else 'client'
+            service = dict(template)
+            service['ports'] = [f'{baseport + i}:{baseport + i}']
+            service['networks'] = {'vpcbr': {'ipv4_address': node_address(args.subnet, i)}}
+            service['environment'] = dict(
+                template['environment'], PID=i, TOPOLOGY=args.topology_file, ALGORITHM=algorithm, **run_args
+            )
+            dumped = yaml.safe_dump({f'node{i}': service})
+            f.write(''.join(f'  {line}\n' for line in dumped.splitlines()))
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -8,39 +67,33 @@ if __name__ == '__main__':
         description='Scale the number of nodes',
         epilog='Designed for A27 Fundamentals and Design of Blockchain-based Systems')
     parser.add_argument('num_nodes', type=int)
-    parser.add_argument('topology_file', type=str, nargs='?', default='topologies/ring.yaml')
+    parser.add_argument('topology_file', type=str, nargs='?', default='topologies/ring.yaml',
+                        help='written in the compact binary format if it ends in .topo')
     parser.add_argument('algorithm', type=str, nargs='?', default='echo')
     parser.add_argument('template_file', type=str, nargs='?', default='docker-compose.template.yml')
+    parser.add_argument('--family', choices=families, default='ring')
+    parser.add_argument('--degree', type=int, default=4,
+                        help='neighbours per node for k-regular and small-world, links per new node for scale-free')
+    parser.add_argument('--rewire', type=float, default=0.1, help='rewiring probability for small-world')
+    parser.add_argument('--validators', type=int, default=3,
+                        help='size of the validator clique for blockchain, the other nodes are clients')
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--subnet', type=str, default=None,
+                        help='docker subnet, defaults to that of the template; a /24 fits 245 nodes')
     args = parser.parse_args()
 
     with open(args.template_file, 'r') as f:
         content = yaml.safe_load(f)
+    if args.subnet is None:
+        args.subnet = content['networks']['vpcbr']['ipam']['config'][0]['subnet']
+    try:
+        node_address(args.subnet, args.num_nodes - 1)  # fail before writing anything if it does not fit
+    except ValueError as e:
+        parser.error(str(e))
 
-        node = content['services']['node0']
-        content['x-common-variables']['TOPOLOGY'] = args.topology_file
-
-        nodes = {}
-        baseport = 9090
-        connections = {}
-
-        # Create a ring topology
-        for i in range(args.num_nodes):
-            n = copy.deepcopy(node)
-            n['ports'] = [f'{baseport + i}:{baseport + i}']
-            n['networks']['vpcbr']['ipv4_address'] = f'192.168.55.{10 + i}'
-            n['environment']['PID'] = i
-            n['environment']['TOPOLOGY'] = args.topology_file
-            n['environment']['ALGORITHM'] = args.algorithm
-            nodes[f'node{i}'] = n
-
-            connections[i] = [(i + 1) % args.num_nodes, (i - 1) % args.num_nodes]
-
-        content['services'] = nodes
-
-        with open('docker-compose.yml', 'w') as f2:
-            yaml.safe_dump(content, f2)
-            print(f'Output written to docker-compose.yml')
+    write_compose(content, args)
+    print(f'Output written to docker-compose.yml')
 
-        with open(args.topology_file, 'w') as f3:
-            yaml.safe_dump(connections, f3)
-            print(f'Output written to {args.topology_file}')
+    write_topology(generate_topology(args), args.topology_file)
+    print(f'Output written to {args.topology_file}')